@@ -3,18 +3,28 @@ Premium Image Background Remover Web Application
 A modern web app for removing image backgrounds using U2Net deep learning model
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, url_for
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context, url_for
 from werkzeug.utils import secure_filename
 import os
+import mimetypes
+import threading
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 from pathlib import Path
+from services.resolution import parse_input_size
+from services.jobs import JobQueue, QueueFull
+from services.storage import FileStore
+from services.gallery_index import GalleryIndex
+from services.retention import RetentionManager
 
 # Import services with error handling
 try:
     from services.background_remover import BackgroundRemoverService
     from services.image_processor import ImageProcessor
+    from services.matting import ALPHA_MODES, alpha_mask_path
+    from services.encoding import ENCODING_PROFILES, available_formats
     MODEL_AVAILABLE = True
 except Exception as e:
     print(f"\n⚠️  Warning: Could not load AI models")
@@ -24,6 +34,10 @@ except Exception as e:
     MODEL_AVAILABLE = False
     BackgroundRemoverService = None
     ImageProcessor = None
+    ALPHA_MODES = None
+    alpha_mask_path = None
+    ENCODING_PROFILES = None
+    available_formats = None
 
 app = Flask(__name__)
 
@@ -31,17 +45,181 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['PROCESSED_FOLDER'] = 'static/processed'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'webp'}
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB default
+app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'webp', 'avif'}
+app.config['MAX_BATCH_SIZE'] = int(os.environ.get('MAX_BATCH_SIZE', 10))  # Files per /api/batch-upload
+mimetypes.add_type('image/avif', '.avif')
+
+# Uploads and results are handled in memory; persisted copies are written by a background writer
+app.config['PERSIST_FILES'] = os.environ.get('PERSIST_FILES', 'True') == 'True'
+app.config['FILE_MEMORY_MB'] = float(os.environ.get('FILE_MEMORY_MB', 256))
+
+# Inference engine: 'torch' or 'onnxruntime', with its own intra-op thread count (0 = backend default)
+app.config['INFERENCE_ENGINE'] = os.environ.get('INFERENCE_ENGINE', 'torch')
+app.config['INFERENCE_THREADS'] = int(os.environ.get('INFERENCE_THREADS', 0))
+
+# Model output head: 'd1' (finest side output) or 'd0' (fused)
+app.config['MODEL_OUTPUT_HEAD'] = os.environ.get('MODEL_OUTPUT_HEAD', 'd1')
+
+# Fold BatchNorm into the preceding convs at load time (eval-only model)
+app.config['MODEL_FUSE_BATCHNORM'] = os.environ.get('MODEL_FUSE_BATCHNORM', 'True') == 'True'
+
+# Inference precision: 'fp32' or 'int8' (CPU, calibrated on sample images at startup)
+app.config['MODEL_PRECISION'] = os.environ.get('MODEL_PRECISION', 'fp32')
+app.config['QUANT_CALIBRATION_DIR'] = os.environ.get('QUANT_CALIBRATION_DIR', 'static/inputs')
+
+# Cache a frozen TorchScript artifact next to the weights for fast cold starts
+app.config['MODEL_COMPILE'] = os.environ.get('MODEL_COMPILE', 'True') == 'True'
+
+# Execution mode: 'default', 'channels_last', 'bf16' (channels_last + bf16 autocast, opt-in)
+# or 'auto' (channels_last when supported, fp32)
+app.config['INFERENCE_EXECUTION_MODE'] = os.environ.get('INFERENCE_EXECUTION_MODE', 'auto')
+
+# Model input size: a multiple of 32 (e.g. 192-640) or 'auto' (picked from image size and queue depth)
+app.config['MODEL_INPUT_SIZE'] = os.environ.get('MODEL_INPUT_SIZE', '320')
+app.config['MODEL_AUTO_SIZES'] = os.environ.get('MODEL_AUTO_SIZES', '192,256,320,480')
+
+# Boundary refinement: re-run the model on full-resolution crops along the mask edge
+app.config['REFINE_EDGES'] = os.environ.get('REFINE_EDGES', 'False') == 'True'
+app.config['REFINE_MAX_TILES'] = int(os.environ.get('REFINE_MAX_TILES', 12))
+
+# Rows composited and encoded at a time; bounds output memory regardless of image size
+app.config['COMPOSITE_STRIP_ROWS'] = int(os.environ.get('COMPOSITE_STRIP_ROWS', 256))
+
+# Output encoding profile ('fast', 'balanced', 'smallest') and threads compressing PNG strips in parallel
+app.config['ENCODING_PROFILE'] = os.environ.get('ENCODING_PROFILE', 'balanced')
+app.config['ENCODER_THREADS'] = int(os.environ.get('ENCODER_THREADS', 2))
+
+# Extra renditions encoded in parallel with every result (name=format[@longest side]); the gallery
+# grid loads the GALLERY_RENDITION one instead of the full-size image
+app.config['RENDITIONS'] = os.environ.get('RENDITIONS', 'thumb=webp@320,preview=jpg@1280')
+app.config['GALLERY_RENDITION'] = os.environ.get('GALLERY_RENDITION', 'thumb')
+
+# Alpha matting: 'binary' (hard threshold), 'soft' (raw probabilities) or 'guided' (guided-filter matte)
+app.config['ALPHA_MODE'] = os.environ.get('ALPHA_MODE', 'binary')
+
+# Store each result's alpha mask next to its upload so background changes never rerun the model
+app.config['PERSIST_MASKS'] = os.environ.get('PERSIST_MASKS', 'True') == 'True'
+
+# Quality tiers (tier=variant[:head][@input_size]) selectable per request, loaded lazily within a memory budget
+app.config['QUALITY_TIERS'] = os.environ.get('QUALITY_TIERS', 'fast=u2netp@256,balanced=u2net@320,best=u2net:d0@480')
+app.config['DEFAULT_QUALITY'] = os.environ.get('DEFAULT_QUALITY', 'balanced')
+app.config['MODEL_MEMORY_BUDGET_MB'] = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 256))
+
+# Inference batching (concurrent requests share one forward pass; 0 = autotuned slots, else 4)
+app.config['INFERENCE_MAX_BATCH'] = int(os.environ.get('INFERENCE_MAX_BATCH', 0))
+app.config['INFERENCE_MAX_WAIT_MS'] = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 15))
+
+# Request pipeline: decode, inference and encode stages with their own threads and bounded queues,
+# so one request decodes while another is in the model and a third encodes
+app.config['PIPELINE_DECODE_THREADS'] = int(os.environ.get('PIPELINE_DECODE_THREADS', 2))
+app.config['PIPELINE_INFER_THREADS'] = int(os.environ.get('PIPELINE_INFER_THREADS', 0))  # 0 = autotuned slots, else 4
+app.config['PIPELINE_ENCODE_THREADS'] = int(os.environ.get('PIPELINE_ENCODE_THREADS', 2))
+app.config['PIPELINE_QUEUE_SIZE'] = int(os.environ.get('PIPELINE_QUEUE_SIZE', 8))
+
+# Inference worker processes per model (0 = in-process); tensors are exchanged through shared memory,
+# so forward passes run outside this process's GIL. Each process holds its own copy of the model.
+app.config['INFERENCE_PROCESSES'] = int(os.environ.get('INFERENCE_PROCESSES', 0))
+
+# Thread counts picked by `python autotune.py`, applied at startup when the file exists
+app.config['THREAD_TUNING_FILE'] = os.environ.get('THREAD_TUNING_FILE', 'thread_tuning.json')
+
+# Threads decoding and encoding the images of a batch upload in parallel
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 4))
+
+# Async jobs: dedicated inference workers behind a bounded queue (full queue -> 429 + Retry-After)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+app.config['JOB_TTL_SECONDS'] = int(os.environ.get('JOB_TTL_SECONDS', 3600))
+
+# Job event streams hold a server thread each: they close after a while with a reconnect hint,
+# and past the stream limit clients get one status event per reconnect (polling)
+app.config['JOB_EVENTS_MAX_SECONDS'] = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', 25))
+app.config['JOB_EVENTS_RETRY_MS'] = int(os.environ.get('JOB_EVENTS_RETRY_MS', 2000))
+app.config['JOB_EVENT_STREAMS'] = int(os.environ.get('JOB_EVENT_STREAMS', 1))
+
+# Retention: a background thread evicts stored files by age, count of processed images and a byte budget
+app.config['MAX_STORED_IMAGES'] = int(os.environ.get('MAX_STORED_IMAGES', 100))
+app.config['CLEANUP_AFTER_DAYS'] = float(os.environ.get('CLEANUP_AFTER_DAYS', 7))
+app.config['RETENTION_ENABLED'] = os.environ.get('RETENTION_ENABLED', 'True') == 'True'
+app.config['RETENTION_DIRS'] = os.environ.get('RETENTION_DIRS', 'static/uploads,static/processed,static/temp,static/results')
+app.config['STORAGE_BUDGET_MB'] = float(os.environ.get('STORAGE_BUDGET_MB', 256))
+app.config['RETENTION_INTERVAL_SECONDS'] = int(os.environ.get('RETENTION_INTERVAL_SECONDS', 300))
+app.config['RETENTION_RESCAN_HOURS'] = float(os.environ.get('RETENTION_RESCAN_HOURS', 6))
+
+# Mask cache: identical uploads with identical settings skip inference (memory LRU + size-bounded disk tier)
+app.config['MASK_CACHE_MEMORY_MB'] = float(os.environ.get('MASK_CACHE_MEMORY_MB', 64))
+app.config['MASK_CACHE_DIR'] = os.environ.get('MASK_CACHE_DIR', 'static/cache/masks')
+app.config['MASK_CACHE_DISK_MB'] = float(os.environ.get('MASK_CACHE_DISK_MB', 512))
 
 # Ensure required directories exist
 for folder in ['static/uploads', 'static/processed', 'static/temp']:
     Path(folder).mkdir(parents=True, exist_ok=True)
 
 # Initialize services
-if MODEL_AVAILABLE:
-    bg_remover = BackgroundRemoverService()
-    image_processor = ImageProcessor()
+storage = FileStore(persist=app.config['PERSIST_FILES'], memory_mb=app.config['FILE_MEMORY_MB'])
+
+# Processed images sorted by creation time: scanned once here, then kept current from storage writes/deletes
+gallery_index = GalleryIndex(app.config['PROCESSED_FOLDER'], app.config['ALLOWED_EXTENSIONS'])
+storage.subscribe(gallery_index.observe)
+
+# Inference worker processes re-import this module and must not run a second eviction thread
+if app.config['RETENTION_ENABLED'] and __name__ != '__mp_main__':
+    retention = RetentionManager(
+        storage,
+        [folder.strip() for folder in app.config['RETENTION_DIRS'].split(',') if folder.strip()],
+        count_directory=app.config['PROCESSED_FOLDER'],
+        max_files=app.config['MAX_STORED_IMAGES'],
+        max_age_days=app.config['CLEANUP_AFTER_DAYS'],
+        max_bytes_mb=app.config['STORAGE_BUDGET_MB'],
+        interval_seconds=app.config['RETENTION_INTERVAL_SECONDS'],
+        rescan_hours=app.config['RETENTION_RESCAN_HOURS']
+    )
+else:
+    retention = None
+
+if __name__ == '__mp_main__':
+    # Inference worker processes re-import this module when started; they load only their own model
+    bg_remover = None
+    image_processor = None
+elif MODEL_AVAILABLE:
+    bg_remover = BackgroundRemoverService(
+        engine=app.config['INFERENCE_ENGINE'],
+        num_threads=app.config['INFERENCE_THREADS'],
+        output_head=app.config['MODEL_OUTPUT_HEAD'],
+        fuse_batchnorm=app.config['MODEL_FUSE_BATCHNORM'],
+        precision=app.config['MODEL_PRECISION'],
+        calibration_dir=app.config['QUANT_CALIBRATION_DIR'],
+        compile_model=app.config['MODEL_COMPILE'],
+        execution_mode=app.config['INFERENCE_EXECUTION_MODE'],
+        max_batch_size=app.config['INFERENCE_MAX_BATCH'],
+        max_batch_wait_ms=app.config['INFERENCE_MAX_WAIT_MS'],
+        quality_tiers=app.config['QUALITY_TIERS'],
+        default_quality=app.config['DEFAULT_QUALITY'],
+        model_memory_budget_mb=app.config['MODEL_MEMORY_BUDGET_MB'],
+        input_size=app.config['MODEL_INPUT_SIZE'],
+        auto_input_sizes=app.config['MODEL_AUTO_SIZES'],
+        refine_edges=app.config['REFINE_EDGES'],
+        refine_max_tiles=app.config['REFINE_MAX_TILES'],
+        alpha_mode=app.config['ALPHA_MODE'],
+        mask_cache_memory_mb=app.config['MASK_CACHE_MEMORY_MB'],
+        mask_cache_dir=app.config['MASK_CACHE_DIR'],
+        mask_cache_disk_mb=app.config['MASK_CACHE_DISK_MB'],
+        persist_masks=app.config['PERSIST_MASKS'],
+        storage=storage,
+        composite_strip_rows=app.config['COMPOSITE_STRIP_ROWS'],
+        encoding_profile=app.config['ENCODING_PROFILE'],
+        encoder_threads=app.config['ENCODER_THREADS'],
+        batch_workers=app.config['BATCH_WORKERS'],
+        decode_threads=app.config['PIPELINE_DECODE_THREADS'],
+        infer_threads=app.config['PIPELINE_INFER_THREADS'],
+        encode_threads=app.config['PIPELINE_ENCODE_THREADS'],
+        pipeline_queue_size=app.config['PIPELINE_QUEUE_SIZE'],
+        inference_processes=app.config['INFERENCE_PROCESSES'],
+        thread_tuning_file=app.config['THREAD_TUNING_FILE'],
+        renditions=app.config['RENDITIONS']
+    )
+    image_processor = ImageProcessor(storage, bg_remover.encoder, bg_remover.renditions)
 else:
     bg_remover = None
     image_processor = None
@@ -58,6 +236,66 @@ def generate_unique_filename(original_filename):
     unique_id = str(uuid.uuid4())[:8]
     return f"{timestamp}_{unique_id}.{ext}"
 
+def get_processing_options():
+    """Read background removal options from the request form"""
+    return {
+        'background_color': request.form.get('background_color', 'transparent'),
+        'background_image': request.form.get('background_image'),
+        'output_format': request.form.get('output_format', 'png'),
+        'encoding_profile': request.form.get('encoding_profile') or None,
+        'lossless': request.form.get('lossless', 'false').lower() in ('true', '1', 'yes'),
+        'alpha_mode': request.form.get('alpha_mode') or app.config['ALPHA_MODE'],
+        'quality': request.form.get('quality') or None,
+        'input_size': request.form.get('input_size') or None,
+        'refine_edges': request.form.get('refine_edges', str(app.config['REFINE_EDGES'])).lower() in ('true', '1', 'yes')
+    }
+
+def invalid_options(options):
+    """Error response if a processing option is invalid, else None"""
+    quality = options.get('quality')
+    if quality and bg_remover is not None and quality not in bg_remover.quality_tiers:
+        allowed = ', '.join(bg_remover.quality_tiers)
+        return jsonify({'error': f'Invalid quality. Allowed: {allowed}'}), 400
+    
+    if bg_remover is not None and options.get('alpha_mode') not in ALPHA_MODES:
+        return jsonify({'error': f"Invalid alpha_mode. Allowed: {', '.join(ALPHA_MODES)}"}), 400
+    
+    if bg_remover is not None:
+        error = invalid_encoding(options.get('output_format'), options.get('encoding_profile'))
+        if error:
+            return error
+    
+    try:
+        options['input_size'] = parse_input_size(options.get('input_size'))
+    except ValueError:
+        return jsonify({'error': "Invalid input_size. Use a number (e.g. 256, 320, 480) or 'auto'"}), 400
+    return None
+
+def invalid_encoding(output_format, encoding_profile):
+    """Error response if the output format or encoding profile is invalid, else None"""
+    if output_format not in available_formats():
+        return jsonify({'error': f"Invalid output_format. Allowed: {', '.join(available_formats())}"}), 400
+    if encoding_profile and encoding_profile not in ENCODING_PROFILES:
+        return jsonify({'error': f"Invalid encoding_profile. Allowed: {', '.join(ENCODING_PROFILES)}"}), 400
+    return None
+
+def rendition_urls(renditions):
+    """Media URLs for a result's renditions, given {name: filename} or {name: stats with 'filename'}"""
+    return {
+        name: url_for('media', folder='processed',
+                      filename=rendition['filename'] if isinstance(rendition, dict) else rendition)
+        for name, rendition in renditions.items()
+    }
+
+def parse_date_param(value, end_of_day=False):
+    """Timestamp for an ISO date/datetime query value (None if absent); a bare end date covers the whole day"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
 @app.route('/')
 def index():
     """Main page"""
@@ -76,19 +314,13 @@ def upload_file():
             return jsonify({'error': 'No file selected'}), 400
         
         if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, WEBP'}), 400
-        
-        # Save uploaded file
-        filename = generate_unique_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+            return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, WEBP, AVIF'}), 400
         
-        # Get processing options
-        options = {
-            'background_color': request.form.get('background_color', 'transparent'),
-            'background_image': request.form.get('background_image'),
-            'output_format': request.form.get('output_format', 'png')
-        }
+        # Get processing options (validated before anything is stored)
+        options = get_processing_options()
+        error = invalid_options(options)
+        if error:
+            return error
         
         # Check if model is available
         if not MODEL_AVAILABLE or bg_remover is None:
@@ -97,28 +329,192 @@ def upload_file():
                 'download_url': 'https://aka.ms/vs/17/release/vc_redist.x64.exe'
             }), 503
         
+        # Keep the upload in memory; the persisted copy is written in the background
+        filename = generate_unique_filename(file.filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        image_data = file.read()
+        storage.write(filepath, image_data)
+        
         # Process image
-        processed_filename = bg_remover.remove_background(filepath, options)
+        encoding = {}
+        processed_filename = bg_remover.remove_background(filepath, options, image_data, encoding)
         
         # Get file info
-        original_size = os.path.getsize(filepath)
+        original_size = len(image_data)
         processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-        processed_size = os.path.getsize(processed_path)
+        processed_size = storage.size(processed_path)
         
         return jsonify({
             'success': True,
-            'original_url': url_for('static', filename=f'uploads/{filename}'),
-            'processed_url': url_for('static', filename=f'processed/{processed_filename}'),
+            'original_url': url_for('media', folder='uploads', filename=filename),
+            'processed_url': url_for('media', folder='processed', filename=processed_filename),
             'original_filename': filename,
             'processed_filename': processed_filename,
             'original_size': original_size,
             'processed_size': processed_size,
+            'renditions': rendition_urls(encoding.pop('renditions', {})),
+            'encoding': encoding,
             'timestamp': datetime.now().isoformat()
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def process_job(payload, progress):
+    """Run one queued background removal job on a job worker"""
+    encoding = {}
+    processed_filename = bg_remover.remove_background(payload['filepath'], payload['options'],
+                                                      payload['image_data'], encoding, progress)
+    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
+    renditions = encoding.pop('renditions', {})
+    return {
+        'original_filename': payload['filename'],
+        'processed_filename': processed_filename,
+        'original_size': len(payload['image_data']),
+        'processed_size': storage.size(processed_path),
+        'renditions': {name: rendition['filename'] for name, rendition in renditions.items()},
+        'encoding': encoding
+    }
+
+jobs = JobQueue(process_job, app.config['JOB_WORKERS'], app.config['JOB_QUEUE_SIZE'],
+                app.config['JOB_TTL_SECONDS']) if bg_remover is not None else None
+event_streams = threading.BoundedSemaphore(max(1, app.config['JOB_EVENT_STREAMS']))
+
+def job_status(job):
+    """Job status, plus result URLs once it is done"""
+    status = job.to_dict()
+    status['status_url'] = url_for('get_job', job_id=job.id)
+    status['events_url'] = url_for('job_events', job_id=job.id)
+    if job.status == 'done':
+        result = dict(job.result)
+        result['original_url'] = url_for('media', folder='uploads', filename=result['original_filename'])
+        result['processed_url'] = url_for('media', folder='processed', filename=result['processed_filename'])
+        result['renditions'] = rendition_urls(result['renditions'])
+        status['result'] = result
+    return status
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a background removal job and return immediately"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, WEBP, AVIF'}), 400
+        
+        # Check if model is available
+        if not MODEL_AVAILABLE or jobs is None:
+            return jsonify({'error': 'AI model not available'}), 503
+        
+        options = get_processing_options()
+        error = invalid_options(options)
+        if error:
+            return error
+        
+        filename = generate_unique_filename(file.filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        image_data = file.read()
+        storage.write(filepath, image_data)
+        
+        try:
+            job = jobs.submit({
+                'filename': filename,
+                'filepath': filepath,
+                'image_data': image_data,
+                'options': options
+            })
+        except QueueFull as e:
+            storage.delete(filepath)
+            response = jsonify({'error': 'Server busy, please retry later', 'retry_after': e.retry_after})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 429
+        
+        response = jsonify(dict(job_status(job), success=True))
+        response.headers['Location'] = url_for('get_job', job_id=job.id)
+        return response, 202
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Job status and progress; includes the result once done"""
+    job = jobs.get(job_id) if jobs is not None else None
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status(job))
+
+@app.route('/api/jobs/<job_id>/result')
+def get_job_result(job_id):
+    """Job result (same fields as /api/upload), 202 while still running"""
+    job = jobs.get(job_id) if jobs is not None else None
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    status = job_status(job)
+    if status['status'] == 'failed':
+        return jsonify({'error': status['error']}), 500
+    if status['status'] != 'done':
+        return jsonify(status), 202
+    return jsonify(dict(status['result'], success=True))
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-Sent Events stream of job progress, closed when the job finishes
+    
+    A stream ties up one of the few server threads, so it also closes after
+    JOB_EVENTS_MAX_SECONDS with a retry hint; EventSource then reconnects and
+    resumes from Last-Event-ID. Beyond JOB_EVENT_STREAMS open streams a
+    connection gets the current status and closes at once, which turns the
+    stream into polling at the retry interval.
+    """
+    job = jobs.get(job_id) if jobs is not None else None
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Resume after the last event the client saw (a finished job always sends its final event)
+    last_event = request.headers.get('Last-Event-ID', '')
+    resume = int(last_event) if last_event.isdigit() and not job.finished else None
+    
+    def stream():
+        # Taken inside the generator, so it is released however the response ends
+        held = event_streams.acquire(blocking=False)
+        try:
+            yield f"retry: {app.config['JOB_EVENTS_RETRY_MS']}\n\n"
+            deadline = time.monotonic() + (app.config['JOB_EVENTS_MAX_SECONDS'] if held else 0)
+            seen = resume
+            while True:
+                remaining = deadline - time.monotonic()
+                if seen is None:
+                    version = job.version
+                else:
+                    version = job.wait_for_change(seen, timeout=min(15, max(0, remaining)))
+                if version == seen:
+                    if remaining <= 0:
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                seen = version
+                
+                status = job_status(job)
+                event = status['status'] if status['status'] in ('done', 'failed') else 'progress'
+                yield f"id: {version}\nevent: {event}\ndata: {json.dumps(status)}\n\n"
+                if event != 'progress':
+                    return
+        finally:
+            if held:
+                event_streams.release()
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/batch-upload', methods=['POST'])
 def batch_upload():
     """Handle batch file upload"""
@@ -128,37 +524,53 @@ def batch_upload():
         if not files or len(files) == 0:
             return jsonify({'error': 'No files provided'}), 400
         
-        if len(files) > 10:
-            return jsonify({'error': 'Maximum 10 files allowed per batch'}), 400
+        max_files = app.config['MAX_BATCH_SIZE']
+        if len(files) > max_files:
+            return jsonify({'error': f'Maximum {max_files} files allowed per batch'}), 400
         
         results = []
-        options = {
-            'background_color': request.form.get('background_color', 'transparent'),
-            'background_image': request.form.get('background_image'),
-            'output_format': request.form.get('output_format', 'png')
-        }
+        options = get_processing_options()
+        error = invalid_options(options)
+        if error:
+            return error
+        
+        # Check if model is available
+        if not MODEL_AVAILABLE or bg_remover is None:
+            return jsonify({'error': 'AI model not available'}), 503
         
+        uploads = []
         for file in files:
             if file and allowed_file(file.filename):
                 filename = generate_unique_filename(file.filename)
                 filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                
-                try:
-                    processed_filename = bg_remover.remove_background(filepath, options)
-                    results.append({
-                        'success': True,
-                        'original_url': url_for('static', filename=f'uploads/{filename}'),
-                        'processed_url': url_for('static', filename=f'processed/{processed_filename}'),
-                        'original_filename': file.filename,
-                        'processed_filename': processed_filename
-                    })
-                except Exception as e:
-                    results.append({
-                        'success': False,
-                        'original_filename': file.filename,
-                        'error': str(e)
-                    })
+                image_data = file.read()
+                storage.write(filepath, image_data)
+                uploads.append((file.filename, filename, filepath, image_data))
+        
+        # Decode concurrently, infer as stacked tensors, encode in parallel
+        outcomes = bg_remover.remove_background_batch(
+            [(filepath, image_data) for _, _, filepath, image_data in uploads], options)
+        
+        for (original_filename, filename, _, _), outcome in zip(uploads, outcomes):
+            if isinstance(outcome, Exception):
+                results.append({
+                    'success': False,
+                    'original_filename': original_filename,
+                    'error': str(outcome)
+                })
+                continue
+            
+            processed_filename, encoding = outcome
+            results.append({
+                'success': True,
+                'original_url': url_for('media', folder='uploads', filename=filename),
+                'processed_url': url_for('media', folder='processed', filename=processed_filename),
+                'original_filename': original_filename,
+                'upload_filename': filename,
+                'processed_filename': processed_filename,
+                'renditions': rendition_urls(encoding.pop('renditions', {})),
+                'encoding': encoding
+            })
         
         return jsonify({
             'success': True,
@@ -172,15 +584,36 @@ def batch_upload():
 
 @app.route('/api/download/<filename>')
 def download_file(filename):
-    """Download processed image"""
+    """Download processed image, or one of its renditions with ?rendition=<name>"""
     try:
+        filename = secure_filename(filename)
+        rendition = request.args.get('rendition')
+        if rendition:
+            filename = gallery_index.renditions(filename).get(rendition)
+            if filename is None:
+                return jsonify({'error': f"No '{rendition}' rendition for this image"}), 404
+        
         filepath = os.path.join(app.config['PROCESSED_FOLDER'], filename)
-        if not os.path.exists(filepath):
+        data = storage.open(filepath)
+        if data is None:
             return jsonify({'error': 'File not found'}), 404
-        return send_file(filepath, as_attachment=True)
+        return send_file(data, as_attachment=True, download_name=filename,
+                         mimetype=mimetypes.guess_type(filename)[0])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/media/<folder>/<filename>')
+def media(folder, filename):
+    """Serve an upload or result from memory, or from disk once persisted"""
+    folders = {'uploads': app.config['UPLOAD_FOLDER'], 'processed': app.config['PROCESSED_FOLDER']}
+    if folder not in folders:
+        return jsonify({'error': 'Resource not found'}), 404
+    
+    data = storage.open(os.path.join(folders[folder], secure_filename(filename)))
+    if data is None:
+        return jsonify({'error': 'File not found'}), 404
+    return send_file(data, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+
 @app.route('/api/change-background', methods=['POST'])
 def change_background():
     """Change background of already processed image"""
@@ -189,20 +622,50 @@ def change_background():
         original_file = data.get('original_file')
         background_type = data.get('background_type', 'color')
         background_value = data.get('background_value', '#ffffff')
+        output_format = data.get('output_format', 'png')
+        encoding_profile = data.get('encoding_profile')
         
         if not original_file:
             return jsonify({'error': 'Original file required'}), 400
         
-        # Process with new background
-        result = image_processor.change_background(
-            original_file,
-            background_type,
-            background_value
-        )
+        if image_processor is None:
+            return jsonify({'error': 'AI model not available'}), 503
+        
+        error = invalid_encoding(output_format, encoding_profile)
+        if error:
+            return error
+        
+        encoding = {}
+        
+        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(original_file))
+        mask_path = alpha_mask_path(upload_path)
+        
+        if storage.exists(upload_path) and storage.exists(mask_path):
+            # Recomposite original + stored alpha mask, no model call
+            result = image_processor.recomposite(
+                upload_path,
+                mask_path,
+                background_type,
+                background_value,
+                output_format,
+                encoding_profile,
+                encoding
+            )
+        elif os.path.exists(original_file):
+            # Already processed transparent PNG
+            result = image_processor.change_background(
+                original_file,
+                background_type,
+                background_value
+            )
+        else:
+            return jsonify({'error': 'No stored mask for this image. Please upload it again.'}), 404
         
         return jsonify({
             'success': True,
-            'url': url_for('static', filename=f'processed/{result}')
+            'url': url_for('media', folder='processed', filename=result),
+            'renditions': rendition_urls(encoding.pop('renditions', {})),
+            'encoding': encoding
         })
     
     except Exception as e:
@@ -215,37 +678,50 @@ def gallery():
 
 @app.route('/api/gallery')
 def get_gallery():
-    """Get list of processed images"""
+    """
+    Get a page of processed images, newest first
+    
+    Query parameters: cursor (next_cursor of the previous page), limit (default 50),
+    format (png, jpg, webp, avif), since and until (ISO dates or datetimes)
+    """
     try:
-        processed_dir = app.config['PROCESSED_FOLDER']
-        images = []
-        
-        for filename in os.listdir(processed_dir):
-            if allowed_file(filename):
-                filepath = os.path.join(processed_dir, filename)
-                stat = os.stat(filepath)
-                images.append({
-                    'filename': filename,
-                    'url': url_for('static', filename=f'processed/{filename}'),
-                    'size': stat.st_size,
-                    'created': datetime.fromtimestamp(stat.st_ctime).isoformat()
-                })
+        try:
+            limit = min(max(1, int(request.args.get('limit', 50))), 200)
+            since = parse_date_param(request.args.get('since'))
+            until = parse_date_param(request.args.get('until'), end_of_day=True)
+            page, next_cursor = gallery_index.page(request.args.get('cursor'), limit, since, until,
+                                                   request.args.get('format'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid gallery query: {e}'}), 400
         
-        # Sort by creation time, newest first
-        images.sort(key=lambda x: x['created'], reverse=True)
+        images = []
+        for filename, created, size, renditions in page:
+            url = url_for('media', folder='processed', filename=filename)
+            urls = rendition_urls(renditions)
+            images.append({
+                'filename': filename,
+                'url': url,
+                'thumbnail_url': urls.get(app.config['GALLERY_RENDITION'], url),
+                'renditions': urls,
+                'size': size,
+                'created': datetime.fromtimestamp(created).isoformat()
+            })
         
-        return jsonify({'images': images[:50]})  # Return last 50 images
+        return jsonify({'images': images, 'next_cursor': next_cursor, 'total': len(gallery_index)})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/delete/<filename>', methods=['DELETE'])
 def delete_file(filename):
-    """Delete a processed image"""
+    """Delete a processed image and its renditions"""
     try:
+        filename = secure_filename(filename)
+        for rendition in gallery_index.renditions(filename).values():
+            storage.delete(os.path.join(app.config['PROCESSED_FOLDER'], rendition))
+        
         filepath = os.path.join(app.config['PROCESSED_FOLDER'], filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if storage.delete(filepath):
             return jsonify({'success': True})
         return jsonify({'error': 'File not found'}), 404
     except Exception as e:
@@ -253,17 +729,26 @@ def delete_file(filename):
 
 @app.route('/api/health')
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (model stats are None when running without the model)"""
+    model = bg_remover is not None
     return jsonify({
         'status': 'healthy',
-        'model_loaded': bg_remover.is_model_loaded(),
+        'model_loaded': bg_remover.is_model_loaded() if model else False,
+        'models': bg_remover.loaded_models() if model else [],
+        'mask_cache': bg_remover.mask_cache.stats() if model else None,
+        'pending_writes': storage.pending(),
+        'encoding': bg_remover.encoder.stats() if model else None,
+        'jobs': jobs.stats() if jobs is not None else None,
+        'pipeline': bg_remover.pipeline.stats() if model else None,
+        'retention': retention.stats() if retention is not None else None,
         'timestamp': datetime.now().isoformat()
     })
 
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error"""
-    return jsonify({'error': 'File too large. Maximum size is 16MB'}), 413
+    max_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'error': f'File too large. Maximum size is {max_mb}MB'}), 413
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,160 @@
+"""
+Thread Count Autotuner
+Benchmarks combinations of torch intra-op threads, inter-op threads, concurrent
+inference slots and OpenCV threads with the real U2Net on this machine, and
+writes the best throughput/latency configuration for the service to apply at startup
+
+Each combination runs in a fresh process, since torch's thread pools can only
+be sized once per process.
+
+Usage:
+    python autotune.py [--size 320] [--requests 24] [--max-p99-ratio 1.5] [--output thread_tuning.json]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from download_model import MODEL_PATH
+from services.resolution import parse_input_size
+
+# Marks the result line in a trial's output (model loading prints its own progress)
+RESULT_PREFIX = 'AUTOTUNE_RESULT '
+
+
+def candidate_settings(cores):
+    """Thread combinations worth trying on a machine with this many cores"""
+    intra_options = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+    slot_options = (1, 2, 4)
+    for intra, inter, slots, opencv in itertools.product(intra_options, (1, 2), slot_options, (1, cores)):
+        # Skip combinations that oversubscribe the cores more than twice over
+        if intra * slots > 2 * cores:
+            continue
+        yield {
+            'intra_op_threads': intra,
+            'inter_op_threads': inter,
+            'inference_slots': slots,
+            'opencv_threads': opencv
+        }
+
+
+def run_trial(settings, size, requests, image_size=1024):
+    """
+    Measure one configuration in this process
+
+    Each request runs a forward pass at the model input size through the
+    micro-batcher, then upsamples the mask and computes a guided alpha matte
+    with OpenCV, from inference_slots concurrent threads.
+
+    Returns:
+        Dict with images_per_second, p50_ms and p99_ms
+    """
+    import numpy as np
+    import torch
+    import cv2
+    from services.batching import MicroBatcher
+    from services.engines import TorchEngine
+    from services.matting import compute_alpha
+    from services.thread_tuning import apply_thread_settings
+
+    apply_thread_settings(settings)
+    engine = TorchEngine(str(MODEL_PATH), execution_mode=os.environ.get('INFERENCE_EXECUTION_MODE', 'auto'))
+    engine.load()
+    batcher = MicroBatcher(lambda batch: engine.predict(batch)[:, 0, :, :], settings['inference_slots'])
+    guide = np.random.randint(0, 256, (image_size, image_size), dtype=np.uint8)
+
+    def request(_):
+        start = time.perf_counter()
+        pred = batcher.infer(torch.rand(1, 3, size, size))[0].numpy()
+        mask = cv2.resize((pred * 255).astype(np.uint8), (image_size, image_size), interpolation=cv2.INTER_LINEAR)
+        compute_alpha(guide, mask, 'guided')
+        return time.perf_counter() - start
+
+    slots = settings['inference_slots']
+    with ThreadPoolExecutor(max_workers=slots) as executor:
+        list(executor.map(request, range(slots)))  # warm up
+        start = time.perf_counter()
+        latencies = sorted(executor.map(request, range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'images_per_second': round(requests / elapsed, 2),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1)
+    }
+
+
+def measure(settings, args):
+    """Run a trial in a fresh process and return its measurements, or None if it failed"""
+    command = [sys.executable, __file__, '--trial', json.dumps(settings),
+               '--size', str(args.size), '--requests', str(args.requests)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    print(f"   ❌ Trial failed: {(result.stderr or result.stdout).strip().splitlines()[-1:]}")
+    return None
+
+
+def pick_best(results, max_p99_ratio):
+    """Highest throughput among configurations whose p99 is within max_p99_ratio of the best p99"""
+    best_p99 = min(result['p99_ms'] for result in results)
+    eligible = [result for result in results if result['p99_ms'] <= best_p99 * max_p99_ratio]
+    return max(eligible, key=lambda result: result['images_per_second'])
+
+
+def main():
+    configured_size = parse_input_size(os.environ.get('MODEL_INPUT_SIZE', '320'))
+    parser = argparse.ArgumentParser(description='Autotune thread counts for U2Net serving')
+    parser.add_argument('--size', type=int, default=configured_size if isinstance(configured_size, int) else 320,
+                        help='Model input size (defaults to MODEL_INPUT_SIZE)')
+    parser.add_argument('--requests', type=int, default=24, help='Timed requests per configuration')
+    parser.add_argument('--max-p99-ratio', type=float, default=1.5,
+                        help='Accept at most this multiple of the best p99 latency in exchange for throughput')
+    parser.add_argument('--output', default=os.environ.get('THREAD_TUNING_FILE', 'thread_tuning.json'))
+    parser.add_argument('--trial', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        print(RESULT_PREFIX + json.dumps(run_trial(json.loads(args.trial), args.size, args.requests)))
+        return
+
+    if not MODEL_PATH.exists():
+        print(f"❌ Model not found at {MODEL_PATH}. Run: python download_model.py")
+        sys.exit(1)
+
+    cores = os.cpu_count() or 1
+    candidates = list(candidate_settings(cores))
+    print(f"🖥️  {cores} cores, input {args.size}x{args.size}, {len(candidates)} configurations\n")
+    print(f"{'intra':>6}{'inter':>6}{'slots':>6}{'opencv':>7}{'img/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+
+    results = []
+    for settings in candidates:
+        measured = measure(settings, args)
+        if measured is None:
+            continue
+        results.append(dict(settings, **measured))
+        print(f"{settings['intra_op_threads']:>6}{settings['inter_op_threads']:>6}{settings['inference_slots']:>6}"
+              f"{settings['opencv_threads']:>7}{measured['images_per_second']:>10.2f}"
+              f"{measured['p50_ms']:>9.1f}{measured['p99_ms']:>9.1f}")
+
+    if not results:
+        print("\n❌ No configuration completed")
+        sys.exit(1)
+
+    from services.thread_tuning import save_thread_settings
+    best = dict(pick_best(results, args.max_p99_ratio), input_size=args.size, cores=cores)
+    save_thread_settings(best, args.output)
+    print(f"\n✅ Best: {best['intra_op_threads']} intra-op, {best['inter_op_threads']} inter-op, "
+          f"{best['inference_slots']} slots, {best['opencv_threads']} OpenCV threads "
+          f"({best['images_per_second']} img/s, p99 {best['p99_ms']} ms)")
+    print(f"💾 Saved to {args.output}; the service applies it at startup")
+
+
+if __name__ == '__main__':
+    main()
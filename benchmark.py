@@ -0,0 +1,63 @@
+"""
+Execution Mode Benchmark
+Measures U2Net inference speed for each torch execution mode on this machine
+
+Usage:
+    python benchmark.py [--batch-size 1] [--iterations 10] [--size 320] [--compile]
+"""
+
+import argparse
+import sys
+import time
+
+import torch
+
+from download_model import MODEL_PATH
+from services.engines import EXECUTION_MODES, TorchEngine
+
+
+def benchmark_engine(engine, batch_size, size, iterations, warmup=2):
+    """Average seconds per forward pass of a loaded engine"""
+    batch = torch.rand(batch_size, 3, size, size)
+
+    for _ in range(warmup):
+        engine.predict(batch)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        engine.predict(batch)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark U2Net execution modes')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--size', type=int, default=320, help='Model input size')
+    parser.add_argument('--compile', action='store_true', help='Benchmark the compiled TorchScript model')
+    args = parser.parse_args()
+
+    if not MODEL_PATH.exists():
+        print(f"❌ Model not found at {MODEL_PATH}. Run: python download_model.py")
+        sys.exit(1)
+
+    print(f"🖥️  torch {torch.__version__}, {torch.get_num_threads()} threads, "
+          f"CPU capability: {torch.backends.cpu.get_cpu_capability()}")
+    print(f"📐 Batch {args.batch_size} x {args.size}x{args.size}, {args.iterations} iterations\n")
+
+    results = []
+    for mode in EXECUTION_MODES:
+        engine = TorchEngine(str(MODEL_PATH), compile_model=args.compile, execution_mode=mode)
+        engine.load()
+        seconds = benchmark_engine(engine, args.batch_size, args.size, args.iterations)
+        results.append((mode, engine.describe_execution_mode(), seconds))
+
+    baseline = results[0][2]
+    print(f"\n{'Mode':<15}{'Resolved to':<25}{'ms/batch':>10}{'img/s':>10}{'speedup':>10}")
+    for mode, resolved, seconds in results:
+        print(f"{mode:<15}{resolved:<25}{seconds * 1000:>10.1f}"
+              f"{args.batch_size / seconds:>10.2f}{baseline / seconds:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -21,20 +21,86 @@ class Config:
     MODEL_PATH = BASE_DIR / 'saved_models' / 'u2net' / 'u2net.pth'
     
     # File Upload
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'bmp'}
-    MAX_BATCH_SIZE = 10
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'bmp', 'avif'}
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10))  # Files per /api/batch-upload
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))  # Parallel decode/encode within a batch
     
     # Model
-    MODEL_INPUT_SIZE = 320
+    MODEL_INPUT_SIZE = os.environ.get('MODEL_INPUT_SIZE', '320')  # Multiple of 32 or 'auto'
+    MODEL_AUTO_SIZES = os.environ.get('MODEL_AUTO_SIZES', '192,256,320,480')  # Candidates for 'auto'
+    INFERENCE_ENGINE = os.environ.get('INFERENCE_ENGINE', 'torch')  # 'torch' or 'onnxruntime'
+    INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))  # 0 = backend default
+    MODEL_OUTPUT_HEAD = os.environ.get('MODEL_OUTPUT_HEAD', 'd1')  # 'd1' or fused 'd0'
+    MODEL_FUSE_BATCHNORM = os.environ.get('MODEL_FUSE_BATCHNORM', 'True') == 'True'
+    MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'fp32')  # 'fp32' or 'int8'
+    QUANT_CALIBRATION_DIR = os.environ.get('QUANT_CALIBRATION_DIR', str(BASE_DIR / 'static' / 'inputs'))
+    MODEL_COMPILE = os.environ.get('MODEL_COMPILE', 'True') == 'True'  # Cached TorchScript artifact
+    INFERENCE_EXECUTION_MODE = os.environ.get('INFERENCE_EXECUTION_MODE', 'auto')  # default/channels_last/bf16/auto (fp32)
+    
+    # Boundary refinement (full-resolution crops along the mask edge)
+    REFINE_EDGES = os.environ.get('REFINE_EDGES', 'False') == 'True'
+    REFINE_MAX_TILES = int(os.environ.get('REFINE_MAX_TILES', 12))
+    
+    # Rows composited and encoded at a time (bounds output memory)
+    COMPOSITE_STRIP_ROWS = int(os.environ.get('COMPOSITE_STRIP_ROWS', 256))
+    
+    # Output encoding
+    ENCODING_PROFILE = os.environ.get('ENCODING_PROFILE', 'balanced')  # 'fast', 'balanced' or 'smallest'
+    ENCODER_THREADS = int(os.environ.get('ENCODER_THREADS', 2))  # Parallel PNG strip compression
+    RENDITIONS = os.environ.get('RENDITIONS', 'thumb=webp@320,preview=jpg@1280')  # name=format[@longest side]
+    GALLERY_RENDITION = os.environ.get('GALLERY_RENDITION', 'thumb')  # Rendition shown in the gallery grid
+    
+    # Alpha matting: 'binary' (hard threshold), 'soft' (raw probabilities) or 'guided' (guided-filter matte)
+    ALPHA_MODE = os.environ.get('ALPHA_MODE', 'binary')
+    PERSIST_MASKS = os.environ.get('PERSIST_MASKS', 'True') == 'True'  # Alpha next to each upload
+    
+    # Quality tiers (tier=variant[:head][@input_size]), loaded lazily and evicted LRU within the memory budget
+    QUALITY_TIERS = os.environ.get('QUALITY_TIERS', 'fast=u2netp@256,balanced=u2net@320,best=u2net:d0@480')
+    DEFAULT_QUALITY = os.environ.get('DEFAULT_QUALITY', 'balanced')
+    MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 256))
+    
+    # Async jobs (/api/jobs)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))  # Full queue -> 429 with Retry-After
+    JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 3600))  # Finished jobs stay queryable this long
+    JOB_EVENTS_MAX_SECONDS = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', 25))  # SSE stream length before reconnect
+    JOB_EVENTS_RETRY_MS = int(os.environ.get('JOB_EVENTS_RETRY_MS', 2000))  # Reconnect delay sent to EventSource
+    JOB_EVENT_STREAMS = int(os.environ.get('JOB_EVENT_STREAMS', 1))  # Open streams; others are served as polling
+    
+    # Inference batching
+    INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 0))  # 0 = autotuned slots, else 4
+    INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 15))
+    INFERENCE_PROCESSES = int(os.environ.get('INFERENCE_PROCESSES', 0))  # Model worker processes (0 = in-process)
+    THREAD_TUNING_FILE = os.environ.get('THREAD_TUNING_FILE', 'thread_tuning.json')  # Written by autotune.py
+    
+    # Request pipeline (decode -> infer -> encode stages overlap across requests)
+    PIPELINE_DECODE_THREADS = int(os.environ.get('PIPELINE_DECODE_THREADS', 2))
+    PIPELINE_INFER_THREADS = int(os.environ.get('PIPELINE_INFER_THREADS', 0))  # 0 = autotuned slots, else 4
+    PIPELINE_ENCODE_THREADS = int(os.environ.get('PIPELINE_ENCODE_THREADS', 2))
+    PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 8))  # Per stage; full queues block upstream
+    
+    # Mask cache (identical uploads with identical settings skip inference)
+    MASK_CACHE_MEMORY_MB = float(os.environ.get('MASK_CACHE_MEMORY_MB', 64))
+    MASK_CACHE_DIR = os.environ.get('MASK_CACHE_DIR', str(BASE_DIR / 'static' / 'cache' / 'masks'))
+    MASK_CACHE_DISK_MB = float(os.environ.get('MASK_CACHE_DISK_MB', 512))
     
     # API
     API_RATE_LIMIT = '100 per hour'
     API_KEY_REQUIRED = os.environ.get('API_KEY_REQUIRED', 'False') == 'True'
     
     # Storage
-    MAX_STORED_IMAGES = 100  # Maximum number of processed images to keep
-    CLEANUP_AFTER_DAYS = 7  # Delete images older than this
+    PERSIST_FILES = os.environ.get('PERSIST_FILES', 'True') == 'True'  # Background writer; False keeps files in memory only
+    FILE_MEMORY_MB = float(os.environ.get('FILE_MEMORY_MB', 256))  # In-memory files not (yet) on disk
+    MAX_STORED_IMAGES = int(os.environ.get('MAX_STORED_IMAGES', 100))  # Maximum number of processed images to keep
+    CLEANUP_AFTER_DAYS = float(os.environ.get('CLEANUP_AFTER_DAYS', 7))  # Delete images not accessed for this long
+    
+    # Retention (background eviction enforcing the limits above and a byte budget)
+    RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'True') == 'True'
+    RETENTION_DIRS = os.environ.get('RETENTION_DIRS', 'static/uploads,static/processed,static/temp,static/results')
+    STORAGE_BUDGET_MB = float(os.environ.get('STORAGE_BUDGET_MB', 256))  # Combined size of RETENTION_DIRS
+    RETENTION_INTERVAL_SECONDS = int(os.environ.get('RETENTION_INTERVAL_SECONDS', 300))
+    RETENTION_RESCAN_HOURS = float(os.environ.get('RETENTION_RESCAN_HOURS', 6))  # Picks up files written outside the store
     
     @classmethod
     def init_app(cls, app):
@@ -1,4 +1,5 @@
 import torch
+import torch.fx
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -24,6 +25,9 @@ def _upsample_like(src,tar):
 
     return src
 
+# keep shape-dependent upsampling as a leaf op when FX-tracing (int8 quantization)
+torch.fx.wrap('_upsample_like')
+
 
 ### RSU-7 ###
 class RSU7(nn.Module):#UNet07DRES(nn.Module):
@@ -353,7 +357,7 @@ class U2NET(nn.Module):
 
         self.outconv = nn.Conv2d(6*out_ch,out_ch,1)
 
-    def forward(self,x):
+    def features(self,x):
 
         hx = x
 
@@ -396,6 +400,11 @@ class U2NET(nn.Module):
 
         hx1d = self.stage1d(torch.cat((hx2dup,hx1),1))
 
+        return hx1d, hx2d, hx3d, hx4d, hx5d, hx6
+
+    def forward(self,x):
+
+        hx1d, hx2d, hx3d, hx4d, hx5d, hx6 = self.features(x)
 
         #side output
         d1 = self.side1(hx1d)
@@ -458,7 +467,7 @@ class U2NETP(nn.Module):
 
         self.outconv = nn.Conv2d(6*out_ch,out_ch,1)
 
-    def forward(self,x):
+    def features(self,x):
 
         hx = x
 
@@ -501,6 +510,11 @@ class U2NETP(nn.Module):
 
         hx1d = self.stage1d(torch.cat((hx2dup,hx1),1))
 
+        return hx1d, hx2d, hx3d, hx4d, hx5d, hx6
+
+    def forward(self,x):
+
+        hx1d, hx2d, hx3d, hx4d, hx5d, hx6 = self.features(x)
 
         #side output
         d1 = self.side1(hx1d)
@@ -523,3 +537,57 @@ class U2NETP(nn.Module):
         d0 = self.outconv(torch.cat((d1,d2,d3,d4,d5,d6),1))
 
         return F.sigmoid(d0), F.sigmoid(d1), F.sigmoid(d2), F.sigmoid(d3), F.sigmoid(d4), F.sigmoid(d5), F.sigmoid(d6)
+
+
+### inference-only single head ###
+class U2NETInference(nn.Module):
+    """
+    Inference wrapper around U2NET/U2NETP that returns only the saliency maps in use.
+
+    head='d1' only runs side1 on the finest decoder stage; head='d0' still
+    needs every side output for the fuse conv but skips the unused sigmoids.
+    head='all' returns every head as channels in HEADS order, so one copy
+    of the weights serves requests for either map.
+    The wrapped net keeps its own state dict, so weights load unchanged.
+    Nets without features() (u2net_refactor) run in full and the head is
+    picked from their outputs.
+    """
+
+    HEADS = ('d0', 'd1')
+
+    def __init__(self,net,head='d1'):
+        super(U2NETInference,self).__init__()
+
+        if head not in self.HEADS and head != 'all':
+            raise ValueError(f"Unknown output head '{head}', expected one of {self.HEADS} or 'all'")
+
+        self.net = net
+        self.head = head
+
+    def forward(self,x):
+
+        if not hasattr(self.net, 'features'):
+            outputs = self.net(x)
+            if self.head == 'all':
+                return torch.cat(outputs[:len(self.HEADS)],1)
+            return outputs[self.HEADS.index(self.head)]
+
+        hx1d, hx2d, hx3d, hx4d, hx5d, hx6 = self.net.features(x)
+
+        d1 = self.net.side1(hx1d)
+
+        if self.head == 'd1':
+            return torch.sigmoid(d1)
+
+        d2 = _upsample_like(self.net.side2(hx2d),d1)
+        d3 = _upsample_like(self.net.side3(hx3d),d1)
+        d4 = _upsample_like(self.net.side4(hx4d),d1)
+        d5 = _upsample_like(self.net.side5(hx5d),d1)
+        d6 = _upsample_like(self.net.side6(hx6),d1)
+
+        d0 = self.net.outconv(torch.cat((d1,d2,d3,d4,d5,d6),1))
+
+        if self.head == 'all':
+            return torch.sigmoid(torch.cat((d0,d1),1))
+
+        return torch.sigmoid(d0)
@@ -3,58 +3,264 @@ Background Remover Service using U2Net Model
 Handles the core background removal functionality
 """
 
+import hashlib
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import numpy as np
 from PIL import Image
 from torchvision import transforms
-from skimage import io
 import torch.nn.functional as F
-from model.u2net import U2NET
+from services.batching import MicroBatcher
+from services.compositor import StripCompositor
+from services.encoding import DEFAULT_RENDITIONS, ImageEncoder, available_formats, parse_renditions
+from services.engines import create_engine
+from services.inference_pool import InferencePool
+from services.mask_cache import MaskCache
+from services.matting import ALPHA_MODES, StripMatte, alpha_mask_path
+from services.model_registry import (DEFAULT_QUALITY_TIERS, MODEL_VARIANTS, LoadedModel, ModelRegistry,
+                                     parse_quality_tiers, weights_size)
+from services.pipeline import StagePipeline
+from services.refinement import BoundaryRefiner
+from services.resolution import DEFAULT_AUTO_SIZES, choose_input_size, parse_auto_sizes, parse_input_size
+from services.storage import FileStore
+from services.thread_tuning import apply_thread_settings, load_thread_settings
 import cv2
+from model.u2net import U2NETInference
 
 class BackgroundRemoverService:
     """Service for removing backgrounds from images using U2Net"""
     
-    def __init__(self, model_path='saved_models/u2net/u2net.pth'):
-        """Initialize the background remover service"""
-        self.model_path = model_path
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = None
+    def __init__(self, model_path='saved_models/u2net/u2net.pth', engine='torch', num_threads=0,
+                 output_head='d1', fuse_batchnorm=True, precision='fp32', calibration_dir='static/inputs',
+                 calibration_images=8, compile_model=True, execution_mode='default', max_batch_size=0,
+                 max_batch_wait_ms=15, quality_tiers=DEFAULT_QUALITY_TIERS, default_quality='balanced',
+                 model_memory_budget_mb=0, input_size=320, auto_input_sizes=DEFAULT_AUTO_SIZES,
+                 refine_edges=False, refine_max_tiles=12, alpha_mode='binary', mask_cache_memory_mb=64,
+                 mask_cache_dir='static/cache/masks', mask_cache_disk_mb=512, persist_masks=True,
+                 storage=None, composite_strip_rows=256, encoding_profile='balanced', encoder_threads=2,
+                 batch_workers=4, decode_threads=2, infer_threads=0, encode_threads=2, pipeline_queue_size=8,
+                 inference_processes=0, thread_tuning_file=None,
+                 renditions=DEFAULT_RENDITIONS):
+        """
+        Initialize the background remover service
+        
+        Args:
+            model_path: Path to the U2Net weights
+            engine: Inference backend, 'torch' or 'onnxruntime'
+            num_threads: Intra-op threads for the engine (0 keeps the backend default)
+            output_head: Default saliency map, 'd1' (finest side output) or 'd0' (fused)
+            fuse_batchnorm: Fold REBNCONV BatchNorms into their convs at load time (torch)
+            precision: 'fp32' or 'int8' (torch, CPU post-training static quantization)
+            calibration_dir: Folder of sample images used to calibrate int8 ranges
+            calibration_images: Maximum number of calibration images
+            compile_model: Use (and build if stale) a frozen TorchScript artifact next to the weights (torch)
+            execution_mode: 'default', 'channels_last', 'bf16' or 'auto' (torch; auto never enables bf16)
+            max_batch_size: Largest number of concurrent requests stacked into one forward pass
+                (0 = the tuned inference slots, else 4)
+            max_batch_wait_ms: Longest time a request waits for others to join its batch
+            quality_tiers: Tier spec such as 'fast=u2netp@256,balanced=u2net,best=u2net:d0@480'
+            default_quality: Tier used when a request does not ask for one
+            model_memory_budget_mb: Combined size of resident models before LRU eviction (0 = unlimited),
+                counting one copy of each even when every inference process holds its own
+            input_size: Default model input size (rounded to a multiple of 32) or 'auto'
+            auto_input_sizes: Candidate sizes for 'auto', picked from source size and queue depth
+            refine_edges: Re-predict the mask edge from full-resolution crops by default
+            refine_max_tiles: Most crops refined per image
+            alpha_mode: Default alpha matting, 'binary', 'soft' or 'guided'
+            mask_cache_memory_mb: In-memory budget for cached masks (0 disables the memory tier)
+            mask_cache_dir: Folder for cached masks on disk (empty disables the disk tier)
+            mask_cache_disk_mb: On-disk budget for cached masks
+            persist_masks: Store each result's alpha next to its upload for model-free background changes
+            storage: FileStore that results are written to (defaults to one persisting in the background)
+            composite_strip_rows: Rows composited and encoded at a time (bounds peak memory)
+            encoding_profile: Default output encoding profile, 'fast', 'balanced' or 'smallest'
+            encoder_threads: Threads compressing PNG strips in parallel
+            batch_workers: Threads decoding and encoding the images of a batch in parallel
+            decode_threads: Pipeline threads reading, decoding and preprocessing requests
+            infer_threads: Pipeline threads waiting on the model (concurrent ones share a forward pass;
+                0 = the tuned inference slots, else 4)
+            encode_threads: Pipeline threads matting, compositing and encoding results
+            pipeline_queue_size: Requests queued in front of each pipeline stage before the previous one blocks
+            inference_processes: Run each model in this many worker processes, exchanging tensors
+                through shared memory (0 runs inference in this process)
+            thread_tuning_file: Result of `python autotune.py`; when present, its thread counts are
+                applied before any model loads and fill in num_threads, max_batch_size and infer_threads
+                where those are left at 0
+            renditions: Extra downscaled outputs encoded with every result, e.g.
+                'thumb=webp@320,preview=jpg@1280' (empty for none)
+        """
+        # Size the torch/OpenCV pools before anything starts them
+        tuning = load_thread_settings(thread_tuning_file)
+        if tuning is not None:
+            apply_thread_settings(tuning)
+            # Explicitly configured values win over tuned ones
+            num_threads = num_threads or tuning['intra_op_threads']
+            max_batch_size = max_batch_size or tuning['inference_slots']
+            infer_threads = infer_threads or tuning['inference_slots']
+            print(f"🧵 Thread tuning from {thread_tuning_file}: {tuning['intra_op_threads']} intra-op, "
+                  f"{tuning['inter_op_threads']} inter-op, {tuning['opencv_threads']} OpenCV, "
+                  f"{tuning['inference_slots']} inference slots")
+        max_batch_size = max_batch_size or 4
+        infer_threads = infer_threads or 4
+        
+        self.model_paths = {variant: path for variant, (_, path) in MODEL_VARIANTS.items()}
+        self.model_paths['u2net'] = model_path
+        self.engine_name = engine
+        if output_head not in U2NETInference.HEADS:
+            raise ValueError(f"Unknown output head '{output_head}', expected one of {U2NETInference.HEADS}")
+        self.output_head = output_head
+        self.engine_options = {
+            'num_threads': num_threads,
+            'fuse_batchnorm': fuse_batchnorm,
+            'precision': precision,
+            'calibration_dir': calibration_dir,
+            'calibration_images': calibration_images,
+            'compile_model': compile_model,
+            'execution_mode': execution_mode,
+            'preprocess': self._preprocess_image
+        }
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
+        self.inference_processes = max(0, int(inference_processes))
+        self.input_size = parse_input_size(input_size) or 320
+        self.auto_input_sizes = parse_auto_sizes(auto_input_sizes)
+        self.refine_edges = refine_edges
+        self.refiner = BoundaryRefiner(max_tiles=refine_max_tiles)
+        if alpha_mode not in ALPHA_MODES:
+            raise ValueError(f"Alpha mode '{alpha_mode}' is not one of {ALPHA_MODES}")
+        self.alpha_mode = alpha_mode
+        self.mask_cache = MaskCache(mask_cache_memory_mb, mask_cache_dir, mask_cache_disk_mb)
+        self.persist_masks = persist_masks
+        self.storage = storage if storage is not None else FileStore()
+        self.encoder = ImageEncoder(StripCompositor(composite_strip_rows), encoder_threads, encoding_profile)
+        self.renditions = parse_renditions(renditions) if isinstance(renditions, str) else renditions
+        for name, (rendition_format, _) in self.renditions.items():
+            if rendition_format not in available_formats():
+                raise ValueError(f"Rendition '{name}' format '{rendition_format}' is not available")
+        self.batch_executor = ThreadPoolExecutor(max_workers=max(1, batch_workers), thread_name_prefix='batch')
+        
+        # Single requests overlap: one decodes while another runs the model and a third encodes
+        self.pipeline = StagePipeline([
+            ('decode', self._decode_stage, decode_threads),
+            ('infer', self._infer_stage, infer_threads),
+            ('encode', self._encode_stage, encode_threads)
+        ], pipeline_queue_size)
+        
+        self.quality_tiers = parse_quality_tiers(quality_tiers) if isinstance(quality_tiers, str) else quality_tiers
+        if default_quality not in self.quality_tiers:
+            raise ValueError(f"Default quality '{default_quality}' is not one of {sorted(self.quality_tiers)}")
+        self.default_quality = default_quality
+        self.registry = ModelRegistry(self._load_model, model_memory_budget_mb)
+        
+        # Load the default tier up front; others load on first request
         self.model_loaded = False
-        self._load_model()
-    
-    def _load_model(self):
-        """Load the U2Net model"""
         try:
-            print("🔄 Loading U2Net model...")
-            self.model = U2NET(3, 1)
-            
-            # Check if model file exists, if not try to download it
-            if not os.path.exists(self.model_path):
-                print("⚠️ Model file not found. Attempting to download...")
-                try:
-                    from download_model import download_model
-                    if not download_model():
-                        raise Exception("Model download failed")
-                except Exception as e:
-                    print(f"❌ Could not download model: {e}")
-                    print(f"   Please manually download and place at: {self.model_path}")
-                    self.model_loaded = False
-                    return
-            
-            # Load pre-trained weights
-            self.model.load_state_dict(torch.load(self.model_path, map_location=self.device))
-            print("✅ Pre-trained model loaded successfully")
-            
-            self.model.to(self.device)
-            self.model.eval()
+            self.get_model()
             self.model_loaded = True
-            print(f"✅ Model ready on {self.device}")
-            
         except Exception as e:
             print(f"❌ Error loading model: {e}")
-            self.model_loaded = False
+    
+    def _load_model(self, variant):
+        """Load a model variant into the configured inference engine, computing every head its tiers use"""
+        build_net, _ = MODEL_VARIANTS[variant]
+        model_path = self.model_paths[variant]
+        heads = self._variant_heads(variant)
+        print(f"🔄 Loading {variant} model ({self.engine_name} engine, heads {', '.join(heads)})...")
+        
+        # Check if model file exists, if not try to download it
+        if not os.path.exists(model_path):
+            if variant != 'u2net':
+                raise Exception(f"Model file not found. Please place {variant} weights at: {model_path}")
+            
+            print("⚠️ Model file not found. Attempting to download...")
+            try:
+                from download_model import download_model
+                if not download_model():
+                    raise Exception("Model download failed")
+            except Exception as e:
+                print(f"❌ Could not download model: {e}")
+                print(f"   Please manually download and place at: {model_path}")
+                raise
+        
+        # One network per variant: a single head is computed alone, several come out as channels
+        output_head = heads[0] if len(heads) == 1 else 'all'
+        options = dict(self.engine_options, output_head=output_head, artifact_name=f"{variant}_{output_head}",
+                       build_net=build_net)
+        if self.inference_processes:
+            # Each worker process loads its own copy; batches run on whichever worker is idle
+            calibration_size = self.input_size if isinstance(self.input_size, int) else 320
+            engine = InferencePool(self.engine_name, model_path, variant, self.inference_processes,
+                                   calibration_size, **options)
+        else:
+            engine = create_engine(self.engine_name, model_path, **options)
+        engine.load()
+        
+        # Each model gets its own batcher: different networks can't share a forward pass,
+        # but requests for different heads of the same network can
+        batcher = MicroBatcher(engine.predict, self.max_batch_size, self.max_batch_wait_ms,
+                               workers=max(1, self.inference_processes))
+        # The budget counts one copy; with inference processes each worker holds its own
+        return LoadedModel(variant, engine, batcher, weights_size(model_path), heads)
+    
+    def _variant_heads(self, variant):
+        """Output heads the quality tiers use for a variant, in U2NETInference.HEADS order"""
+        used = {head or self.output_head for tier_variant, head, _ in self.quality_tiers.values()
+                if tier_variant == variant}
+        return tuple(head for head in U2NETInference.HEADS if head in used) or (self.output_head,)
+    
+    def get_model(self, quality=None):
+        """Return the loaded model for a quality tier, loading it on first use"""
+        return self._resolve_model(quality)[0]
+    
+    def _resolve_model(self, quality=None):
+        """
+        (loaded model, output head) for a quality tier
+        
+        Falls back to the default tier if the requested tier's model can't be loaded.
+        """
+        tier = self._tier(quality)
+        variant, head, _ = self.quality_tiers[tier]
+        try:
+            return self.registry.get(variant), head or self.output_head
+        except Exception as e:
+            if tier == self.default_quality:
+                raise
+            print(f"⚠️ Quality '{tier}' unavailable ({e}), using '{self.default_quality}'")
+            return self._resolve_model(self.default_quality)
+    
+    def _tier(self, quality):
+        """Validated tier name for a requested quality"""
+        tier = quality or self.default_quality
+        if tier not in self.quality_tiers:
+            raise ValueError(f"Unknown quality '{tier}'. Allowed: {', '.join(self.quality_tiers)}")
+        return tier
+    
+    def _resolve_input_size(self, requested, source_size, queue_depth=0):
+        """
+        Model input size for one image
+        
+        Args:
+            requested: Size or 'auto' from the request or tier (None for the service default)
+            source_size: (width, height) of the original image
+            queue_depth: Other requests waiting on the same model
+        """
+        size = parse_input_size(requested) or self.input_size
+        if size == 'auto':
+            return choose_input_size(source_size, queue_depth, self.max_batch_size, self.auto_input_sizes)
+        return size
+    
+    def _input_size_for(self, image_data, requested, queue_depth=0):
+        """Concrete model input size for an upload; 'auto' reads only the image header"""
+        size = parse_input_size(requested) or self.input_size
+        if size == 'auto':
+            size = self._resolve_input_size(size, Image.open(io.BytesIO(image_data)).size, queue_depth)
+        return size
+    
+    def loaded_models(self):
+        """Names of resident models with the heads they compute, least recently used first"""
+        return [f"{variant}:{'+'.join(self._variant_heads(variant))}" for variant in self.registry.loaded_keys()]
     
     def is_model_loaded(self):
         """Check if model is loaded"""
@@ -68,14 +274,26 @@ class BackgroundRemoverService:
         ])
         return transform(image)
     
-    def _preprocess_image(self, image_path):
-        """Preprocess image for model"""
-        # Load image
-        image = Image.open(image_path).convert('RGB')
+    def _preprocess_image(self, image_path, input_size=None, queue_depth=0):
+        """
+        Preprocess image (path or file object) for model
+        
+        Returns:
+            (input tensor, decoded PIL image, original (width, height)); JPEGs are
+            decoded at a reduced scale, so the image can be smaller than the original
+        """
+        # Read the header only; the size is known before any pixels are decoded
+        image = Image.open(image_path)
         original_size = image.size
         
-        # Resize to 320x320 for model
-        image_resized = image.resize((320, 320), Image.BILINEAR)
+        # Resize to the square model input size
+        size = self._resolve_input_size(input_size, original_size, queue_depth)
+        
+        # JPEG shrink-on-load: decode at the smallest DCT scale (1/2 to 1/8) that
+        # still covers the model input; a no-op for other formats
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image_resized = image.resize((size, size), Image.BILINEAR)
         
         # Convert to tensor
         image_tensor = self._normalize(image_resized)
@@ -83,8 +301,52 @@ class BackgroundRemoverService:
         
         return image_tensor, image, original_size
     
-    def _postprocess_mask(self, mask, original_size):
-        """Postprocess the model output mask"""
+    def _load_image(self, image_data):
+        """Full-resolution RGB decode of encoded image bytes"""
+        return Image.open(io.BytesIO(image_data)).convert('RGB')
+    
+    def _mask_from_prediction(self, model, head, pred, input_size, image, original_size, image_data, refine):
+        """
+        Probability mask from a model output, optionally refined along its edge
+        
+        The mask stays at model resolution (the compositor upsamples it one strip
+        at a time); only edge refinement, which works on full-resolution crops,
+        produces a full-size mask.
+        
+        Returns:
+            (uint8 probability mask, full-resolution PIL image or None if it was never decoded)
+        """
+        # Get prediction
+        output = model.head_output(pred, head)
+        mask = self._postprocess_mask(output)
+        original_image = image if image.size == original_size else None
+        
+        # Optionally re-predict the uncertain edge band from full-resolution crops; sources close
+        # to model resolution keep the coarse mask
+        if refine and self.refiner.should_refine(original_size, input_size):
+            if original_image is None:
+                original_image = self._load_image(image_data)
+            
+            # Crop probabilities get the coarse mask's min-max scaling, so refined band pixels match the rest
+            low, high = float(output.min()), float(output.max())
+            scale = 1.0 / (high - low) if high > low else 1.0
+            def predict_crops(crops):
+                return [(prob - low) * scale for prob in self._predict_crops(model, head, crops, input_size)]
+            
+            mask_np = np.array(mask.resize(original_size, Image.BILINEAR))
+            mask_np = self.refiner.refine(original_image, mask_np, input_size, predict_crops)
+            return mask_np, original_image
+        
+        return np.array(mask), original_image
+    
+    def _predict_crops(self, model, head, crops, input_size):
+        """Run full-resolution crops through the model as one batch and return 2D probability maps"""
+        batch = torch.stack([self._normalize(crop.resize((input_size, input_size), Image.BILINEAR))
+                             for crop in crops])
+        return [pred.numpy() for pred in model.head_output(model.batcher.infer_many(batch), head)]
+    
+    def _postprocess_mask(self, mask):
+        """Postprocess the model output mask (kept at model resolution)"""
         # Convert to numpy
         mask = mask.squeeze().cpu().data.numpy()
         
@@ -92,117 +354,321 @@ class BackgroundRemoverService:
         mask = (mask - mask.min()) / (mask.max() - mask.min())
         mask = (mask * 255).astype(np.uint8)
         
-        # Resize to original size
-        mask = Image.fromarray(mask).resize(original_size, Image.BILINEAR)
-        
-        return mask
+        return Image.fromarray(mask)
     
-    def remove_background(self, image_path, options=None):
+    def remove_background(self, image_path, options=None, image_data=None, report=None, progress=None):
         """
         Remove background from image
         
         Args:
-            image_path: Path to input image
+            image_path: Path to input image (names the outputs)
             options: Dict with processing options:
                 - background_color: 'transparent', '#RRGGBB', or 'white', 'black'
-                - output_format: 'png' or 'jpg'
+                - output_format: 'png', 'jpg', 'webp' or 'avif'
+                - encoding_profile: 'fast', 'balanced' or 'smallest' (default profile if omitted)
+                - lossless: Lossless WebP
+                - alpha_mode: 'binary' (hard threshold), 'soft' or 'guided' (soft edges from the image)
                 - background_image: Path to background image
+                - quality: Quality tier ('fast', 'balanced', 'best'), default tier if omitted
+                - input_size: Model input size (multiple of 32) or 'auto', overrides the tier size
+                - refine_edges: Re-predict the mask edge from full-resolution crops
+            image_data: Encoded input image bytes, so the upload is never re-read from disk
+            report: Optional dict filled with encode stats (format, profile, encoded_bytes, encode_ms),
+                plus 'renditions': name -> the rendition's stats and filename
+            progress: Optional callable taking (percent, stage) as processing advances
         
         Returns:
             Path to processed image
         """
         if options is None:
             options = {}
+        if progress is None:
+            progress = lambda percent, stage: None
         
         if not self.model_loaded:
             raise Exception("Model not loaded. Cannot process image.")
         
         try:
-            # Preprocess
-            image_tensor, original_image, original_size = self._preprocess_image(image_path)
-            image_tensor = image_tensor.to(self.device)
-            
-            # Run model
-            with torch.no_grad():
-                d1, d2, d3, d4, d5, d6, d7 = self.model(image_tensor)
-            
-            # Get prediction
-            pred = d1[:, 0, :, :]
-            pred = self._postprocess_mask(pred, original_size)
-            
-            # Convert original image to numpy array
-            img_np = np.array(original_image)
-            mask_np = np.array(pred)
-            
-            # Ensure mask is properly scaled (0-255 range)
-            # Threshold the mask to create a binary mask (improves edge quality)
-            # Values above 128 are considered foreground
-            mask_np = np.where(mask_np > 128, 255, 0).astype(np.uint8)
-            
-            # Apply mask to create transparent background
-            # Create RGBA image with the mask as alpha channel
-            img_rgba = np.dstack((img_np, mask_np))
-            
-            result_image = Image.fromarray(img_rgba, 'RGBA')
-            
-            # Apply background options
-            background_color = options.get('background_color', 'transparent')
-            
-            if background_color != 'transparent':
-                # Create background
-                bg = self._create_background(original_size, background_color, options)
-                
-                # Composite
-                result_image = Image.alpha_composite(bg, result_image)
-            
-            # Save processed image
-            output_format = options.get('output_format', 'png')
-            output_filename = os.path.basename(image_path).rsplit('.', 1)[0] + f'_processed.{output_format}'
-            output_path = os.path.join('static/processed', output_filename)
-            
-            if output_format == 'jpg':
-                # Convert to RGB for JPEG
-                if result_image.mode == 'RGBA':
-                    rgb_image = Image.new('RGB', result_image.size, (255, 255, 255))
-                    rgb_image.paste(result_image, mask=result_image.split()[3])
-                    result_image = rgb_image
-                result_image.save(output_path, 'JPEG', quality=95)
-            else:
-                result_image.save(output_path, 'PNG')
-            
-            return output_filename
+            # Decode, inference and encode run on separate stage pools, overlapping with other requests
+            return self.pipeline.run({
+                'image_path': image_path,
+                'image_data': image_data,
+                'options': options,
+                'report': report,
+                'progress': progress
+            })
             
         except Exception as e:
             raise Exception(f"Error processing image: {str(e)}")
     
-    def _create_background(self, size, background_color, options):
-        """Create background image with specified color or image"""
+    def _decode_stage(self, request):
+        """Pipeline stage: read the input, check the mask cache and preprocess on a miss"""
+        progress = request['progress']
+        request['image_data'] = self._read_input(request['image_path'], request['image_data'])
         
-        bg = Image.new('RGBA', size, (255, 255, 255, 255))
+        progress(5, 'loading model')
+        model, head, input_size, refine = self._model_settings(request['options'])
+        # 'auto' picks the size from the image and the queue, so resolve it before keying the mask
+        queue_depth = model.batcher.pending() + self.pipeline.queued('infer')
+        input_size = self._input_size_for(request['image_data'], input_size, queue_depth)
+        request.update(model=model, head=head, refine=refine,
+                       key=self._mask_key(request['image_data'], model, head, input_size, refine))
         
-        if background_color.startswith('#'):
-            # Hex color
-            color = self._hex_to_rgb(background_color)
-            bg = Image.new('RGBA', size, color + (255,))
-        elif background_color == 'white':
-            bg = Image.new('RGBA', size, (255, 255, 255, 255))
-        elif background_color == 'black':
-            bg = Image.new('RGBA', size, (0, 0, 0, 255))
-        elif background_color == 'blue':
-            bg = Image.new('RGBA', size, (52, 152, 219, 255))
-        elif background_color == 'green':
-            bg = Image.new('RGBA', size, (46, 204, 113, 255))
-        elif background_color == 'red':
-            bg = Image.new('RGBA', size, (231, 76, 60, 255))
+        request['mask'] = self.mask_cache.get(request['key'])
+        if request['mask'] is None:
+            progress(10, 'decoding')
+            # Hold a batch slot from here to the infer stage, so batches forming meanwhile wait for this input
+            request['slot'] = model.batcher.reserve()
+            try:
+                request['preprocessed'] = self._preprocess_image(io.BytesIO(request['image_data']), input_size)
+            except Exception:
+                request['slot'].release()
+                raise
+        return request
+    
+    def _infer_stage(self, request):
+        """Pipeline stage: predict the mask; concurrent requests share forward passes"""
+        if request['mask'] is not None:
+            return request
+        slot = request.pop('slot')
+        
+        def predict():
+            image_tensor, image, original_size = request.pop('preprocessed')
+            pred = slot.infer(image_tensor)
+            mask, request['image'] = self._mask_from_prediction(request['model'], request['head'], pred,
+                                                                image_tensor.shape[-1], image, original_size,
+                                                                request['image_data'], request['refine'])
+            return mask
+        
+        # Identical uploads with identical settings reuse (or wait for) one prediction
+        request['progress'](15, 'predicting mask')
+        try:
+            request['mask'] = self.mask_cache.get_or_compute(request['key'], predict)
+        finally:
+            # Frees the slot if another request computed this mask (a no-op once submitted)
+            slot.release()
+        request.pop('preprocessed', None)
+        return request
+    
+    def _encode_stage(self, request):
+        """Pipeline stage: matte, composite, encode and store the result"""
+        return self._finish(request['image_path'], request['image_data'], request['options'], request['mask'],
+                            request.get('image'), request['report'], request['progress'])
+    
+    def remove_background_batch(self, items, options=None):
+        """
+        Remove backgrounds from several images as one batch
+        
+        Decodes all images concurrently, runs the mask-cache misses through the
+        model as stacked tensors, then mattes and encodes the results in parallel,
+        so the batch takes about as long as its slowest image. Duplicate images,
+        in the batch or in flight elsewhere, share one prediction.
+        
+        Args:
+            items: List of (image_path, image_data) pairs; image_data may be None
+            options: Processing options shared by all images (see remove_background)
+        
+        Returns:
+            List with one entry per item: (output filename, encode stats), or the
+            Exception that item failed with
+        """
+        if options is None:
+            options = {}
+        
+        if not self.model_loaded:
+            raise Exception("Model not loaded. Cannot process image.")
+        
+        model, head, input_size, refine = self._model_settings(options)
+        queue_depth = model.batcher.pending() + len(items) - 1
+        
+        def decode(item):
+            image_path, image_data = item
+            image_data = self._read_input(image_path, image_data)
+            size = self._input_size_for(image_data, input_size, queue_depth)
+            key = self._mask_key(image_data, model, head, size, refine)
+            mask = self.mask_cache.get(key)
+            if mask is not None:
+                return image_data, key, mask, None, None
+            
+            # Only the first claim of a key (in this batch or any other request) predicts it
+            future, leader = self.mask_cache.claim(key)
+            if not leader:
+                return image_data, key, None, future, None
+            try:
+                return image_data, key, None, future, self._preprocess_image(io.BytesIO(image_data), size)
+            except BaseException as e:
+                self.mask_cache.settle(key, future, error=e)
+                raise
+        
+        decoded = self._run_parallel(decode, items)
+        leaders = [i for i, entry in enumerate(decoded) if not isinstance(entry, Exception) and entry[4] is not None]
+        
+        # Stack the predicted misses (same input size) and run them through the batcher together
+        predictions = {}
+        groups = {}
+        for i in leaders:
+            groups.setdefault(tuple(decoded[i][4][0].shape), []).append(i)
+        for indices in groups.values():
+            try:
+                outputs = model.batcher.infer_many(torch.cat([decoded[i][4][0] for i in indices])).split(1)
+            except Exception as e:
+                outputs = [e] * len(indices)
+            predictions.update(zip(indices, outputs))
+        
+        def predict(i):
+            image_data, key, _, future, (image_tensor, image, original_size) = decoded[i]
+            try:
+                if isinstance(predictions[i], Exception):
+                    raise predictions[i]
+                mask_np, original_image = self._mask_from_prediction(model, head, predictions[i],
+                                                                     image_tensor.shape[-1], image, original_size,
+                                                                     image_data, refine)
+            except BaseException as e:
+                self.mask_cache.settle(key, future, error=e)
+                raise
+            return self.mask_cache.settle(key, future, mask_np), original_image
+        
+        # Settle every claimed key before waiting on any, so duplicates never wait on a queued task
+        masks = dict(zip(leaders, self._run_parallel(predict, leaders)))
+        for i, entry in enumerate(decoded):
+            if not isinstance(entry, Exception) and entry[2] is None and i not in masks:
+                try:
+                    masks[i] = entry[3].result(), None
+                except Exception as e:
+                    masks[i] = e
+        
+        def finish(i):
+            entry = decoded[i]
+            if isinstance(entry, Exception):
+                raise entry
+            image_data, key, mask_np, _, _ = entry
+            original_image = None
+            if mask_np is None:
+                if isinstance(masks[i], Exception):
+                    raise masks[i]
+                mask_np, original_image = masks[i]
+            
+            report = {}
+            filename = self._finish(items[i][0], image_data, options, mask_np, original_image, report)
+            return filename, report
+        
+        results = self._run_parallel(finish, range(len(items)))
+        return [Exception(f"Error processing image: {result}") if isinstance(result, Exception) else result
+                for result in results]
+    
+    def _run_parallel(self, fn, items):
+        """Map fn over items on the batch pool, returning each result or the Exception it raised"""
+        futures = [self.batch_executor.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def _read_input(self, image_path, image_data):
+        """Encoded input bytes, read from storage when not passed in"""
+        if image_data is None:
+            image_data = self.storage.read(image_path)
+            if image_data is None:
+                raise Exception(f"Image not found: {image_path}")
+        return image_data
+    
+    def _model_settings(self, options):
+        """(model, output head, requested input size, refine flag) for a request's options"""
+        model, head = self._resolve_model(options.get('quality'))
+        input_size = options.get('input_size') or self.quality_tiers[self._tier(options.get('quality'))][2]
+        refine = bool(options.get('refine_edges', self.refine_edges))
+        return model, head, input_size, refine
+    
+    def _mask_key(self, image_data, model, head, input_size, refine):
+        """Mask cache key for an upload's bytes and the settings that shape its mask (input_size resolved)"""
+        return self.mask_cache.key(hashlib.sha256(image_data).hexdigest(), self.engine_name,
+                                   self.engine_options['precision'], model.key, head, input_size, refine)
+    
+    def _finish(self, image_path, image_data, options, mask_np, original_image=None, report=None,
+                progress=None):
+        """
+        Matte, composite, encode and store one result
+        
+        Returns:
+            Filename of the processed image
+        """
+        if progress is None:
+            progress = lambda percent, stage: None
+        
+        # Full-resolution decode only now that the composite needs it
+        if original_image is None:
+            original_image = self._load_image(image_data)
+        
+        # The alpha channel (hard threshold or soft matte) is computed from the coarse mask
+        # strip by strip while compositing; the guided filter reads the rows around each strip
+        progress(60, 'matting')
+        alpha = StripMatte(mask_np, options.get('alpha_mode') or self.alpha_mode)
+        
+        # Keep the mask and alpha mode next to the upload so background changes can skip the model
+        if self.persist_masks:
+            self.storage.write(alpha_mask_path(image_path), alpha.encode())
+        
+        # Apply background options
+        background_color = options.get('background_color', 'transparent')
+        output_format = options.get('output_format', 'png')
+        background = self._create_background(background_color, options)
+        
+        # Composite and encode (PNG strip by strip, never holding a full-size RGBA copy);
+        # the downscaled renditions encode in parallel from the same image and alpha
+        progress(75, 'encoding')
+        profile = options.get('encoding_profile')
+        renditions = self.encoder.encode_renditions(original_image, alpha, background, self.renditions, profile)
+        data, stats = self.encoder.encode(original_image, alpha, background, output_format, profile,
+                                          options.get('lossless', False))
+        if report is not None:
+            report.update(stats)
+        
+        # Save processed image
+        stem = os.path.basename(image_path).rsplit('.', 1)[0] + '_processed'
+        output_filename = f'{stem}.{output_format}'
+        self.storage.write(os.path.join('static/processed', output_filename), data)
+        
+        # Save renditions next to it as <stem>.<rendition>.<format>
+        for name, future in renditions.items():
+            rendition_data, rendition_stats = future.result()
+            rendition_filename = f"{stem}.{name}.{rendition_stats['format']}"
+            self.storage.write(os.path.join('static/processed', rendition_filename), rendition_data)
+            if report is not None:
+                report.setdefault('renditions', {})[name] = dict(rendition_stats, filename=rendition_filename)
+        
+        return output_filename
+
+    def _create_background(self, background_color, options):
+        """
+        Background for the compositor
+        
+        Returns:
+            None for transparent, an RGB tuple for a color, or a PIL image that the
+            compositor scales to the output one strip at a time
+        """
+        if background_color == 'transparent':
+            return None
         
         # Handle background image if provided
         background_image_path = options.get('background_image')
         if background_image_path and os.path.exists(background_image_path):
-            bg_img = Image.open(background_image_path).convert('RGBA')
-            bg_img = bg_img.resize(size, Image.BILINEAR)
-            bg = bg_img
+            return Image.open(background_image_path).convert('RGB')
+        
+        if background_color.startswith('#'):
+            # Hex color
+            return self._hex_to_rgb(background_color)
         
-        return bg
+        colors = {
+            'white': (255, 255, 255),
+            'black': (0, 0, 0),
+            'blue': (52, 152, 219),
+            'green': (46, 204, 113),
+            'red': (231, 76, 60)
+        }
+        return colors.get(background_color, (255, 255, 255))
     
     def _hex_to_rgb(self, hex_color):
         """Convert hex color to RGB tuple"""
@@ -0,0 +1,186 @@
+"""
+Micro-Batching Inference Queue
+Collects model inputs from concurrent callers and runs them as one stacked forward pass
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import torch
+
+
+class MicroBatcher:
+    """Scheduler that groups concurrent single-image inferences into batches"""
+
+    def __init__(self, infer_fn, max_batch_size=4, max_wait_ms=15, workers=1):
+        """
+        Initialize the batcher
+
+        Args:
+            infer_fn: Callable taking a stacked (N, C, H, W) tensor and returning
+                a tensor whose first dimension is N
+            max_batch_size: Largest number of inputs run in one forward pass
+            max_wait_ms: Longest time the first queued input waits for company
+            workers: Batches run concurrently (for infer_fns backed by several model processes)
+        """
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._cond = threading.Condition()
+        self._items = []  # pending (tensor, future) pairs
+        self._preparing = 0  # callers holding a slot that have not submitted yet
+        self._closed = False
+        self._stopped = False
+
+        for i in range(max(1, int(workers))):
+            threading.Thread(target=self._run, name=f'micro-batcher-{i}', daemon=True).start()
+
+    @contextmanager
+    def slot(self):
+        """
+        Reserve a place in an upcoming batch while the caller preprocesses.
+
+        The batcher only waits for more inputs while some caller still holds
+        an unsubmitted slot, so a lone request never pays the batching window.
+        """
+        slot = self.reserve()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def reserve(self):
+        """
+        Reserve a slot (see slot()) for callers that preprocess and submit on
+        different threads; the caller must release() it if it never submits
+        """
+        with self._cond:
+            # A closed batcher whose worker already exited serves stragglers inline
+            direct = self._stopped
+            if not direct:
+                self._preparing += 1
+        return _BatchSlot(self, direct)
+
+    def infer(self, tensor):
+        """Run a single (1, C, H, W) tensor through the batcher and wait for its output"""
+        with self.slot() as slot:
+            return slot.infer(tensor)
+
+    def infer_many(self, batch):
+        """
+        Run every row of a (N, C, H, W) tensor through the batcher and wait for all outputs
+
+        Rows are queued together, so they share forward passes with each
+        other and with concurrent callers.
+        """
+        futures = []
+        with self._cond:
+            if not self._stopped:
+                for i in range(batch.shape[0]):
+                    future = Future()
+                    self._items.append((batch[i:i + 1], future))
+                    futures.append(future)
+                self._cond.notify_all()
+
+        # A closed batcher whose worker already exited runs the batch inline
+        if not futures:
+            return self.infer_fn(batch)
+        return torch.cat([future.result() for future in futures], 0)
+
+    def pending(self):
+        """Number of inputs queued or still being prepared"""
+        with self._cond:
+            return len(self._items) + self._preparing
+
+    def close(self):
+        """Stop the worker once every queued and reserved input has been served"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _submit(self, tensor, slot):
+        """Queue a tensor for a held slot and return a Future for its output"""
+        future = Future()
+        with self._cond:
+            self._items.append((tensor, future))
+            slot._released = True
+            self._preparing -= 1
+            self._cond.notify_all()
+        return future
+
+    def _next_batch(self):
+        """Block until a batch is ready and pop it from the queue, or return None once closed and drained"""
+        with self._cond:
+            while not self._items:
+                if self._closed and self._preparing == 0:
+                    self._stopped = True
+                    return None
+                self._cond.wait()
+
+            deadline = time.monotonic() + self.max_wait
+            while len(self._items) < self.max_batch_size and self._preparing > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Only inputs with the same shape can be stacked together
+            shape = self._items[0][0].shape
+            batch, rest = [], []
+            for item in self._items:
+                if item[0].shape == shape and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    rest.append(item)
+            self._items = rest
+
+        return batch
+
+    def _run(self):
+        """Worker loop: collect, run and dispatch batches"""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = [future for _, future in batch]
+
+            try:
+                stacked = torch.cat([tensor for tensor, _ in batch], 0)
+                output = self.infer_fn(stacked)
+                for i, future in enumerate(futures):
+                    future.set_result(output[i:i + 1])
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class _BatchSlot:
+    """A caller's reservation in the batcher"""
+
+    def __init__(self, batcher, direct=False):
+        self._batcher = batcher
+        self._direct = direct
+        self._released = direct
+        self._used = False
+
+    def infer(self, tensor):
+        """Submit the prepared tensor and wait for its output"""
+        if self._used:
+            raise RuntimeError("Batch slot already used")
+        self._used = True
+        if self._direct:
+            return self._batcher.infer_fn(tensor)
+        return self._batcher._submit(tensor, self).result()
+
+    def release(self):
+        """Give up the reservation without submitting (a no-op once submitted)"""
+        with self._batcher._cond:
+            if self._released:
+                return
+            self._released = True
+            self._batcher._preparing -= 1
+            self._batcher._cond.notify_all()
@@ -0,0 +1,180 @@
+"""
+Strip Compositor
+Applies the alpha mask, blends the background and encodes the result in
+horizontal strips, so peak memory is a small multiple of one strip instead of
+several full-size RGBA copies. PNG output is streamed straight into zlib.
+"""
+
+import struct
+import zlib
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Deflate window: each strip is primed with this much of the previous strip's data
+DEFLATE_WINDOW = 32 * 1024
+
+
+class StripCompositor:
+    """Memory-bounded alpha compositing and encoding"""
+
+    def __init__(self, strip_height=256):
+        """
+        Args:
+            strip_height: Rows processed at a time
+        """
+        self.strip_height = max(1, int(strip_height))
+
+    def strips(self, image, alpha, background=None):
+        """
+        Composite strip by strip
+
+        Args:
+            image: Full-resolution PIL RGB foreground
+            alpha: PIL 'L' alpha of any size, upsampled one strip at a time, or a matte
+                computing its rows for the image (rows(image, y0, y1), see matting.StripMatte)
+            background: None (keep transparency), an RGB tuple, or a PIL image
+                that is scaled to the foreground one strip at a time
+
+        Yields:
+            uint8 arrays of shape (rows, width, 4) without a background, else (rows, width, 3)
+        """
+        width, height = image.size
+        if isinstance(background, Image.Image) and background.mode != 'RGB':
+            background = background.convert('RGB')
+
+        for y0 in range(0, height, self.strip_height):
+            y1 = min(height, y0 + self.strip_height)
+            rgb = np.asarray(image.crop((0, y0, width, y1)))
+            if hasattr(alpha, 'rows'):
+                weight = alpha.rows(image, y0, y1)
+            else:
+                weight = np.asarray(scaled_rows(alpha, image.size, y0, y1))
+
+            if background is None:
+                yield np.dstack((rgb, weight))
+                continue
+
+            if isinstance(background, Image.Image):
+                bg = np.asarray(scaled_rows(background, image.size, y0, y1), dtype=np.uint16)
+            else:
+                bg = np.array(background[:3], dtype=np.uint16)
+
+            # Integer blend: 255 * 255 still fits in uint16
+            weight = weight[..., None].astype(np.uint16)
+            blended = rgb * weight + bg * (255 - weight)
+            yield ((blended + 127) // 255).astype(np.uint8)
+
+    def render(self, image, alpha, background=None):
+        """Composite into a single preallocated array (for encoders that need the whole image)"""
+        width, height = image.size
+        out = np.empty((height, width, 4 if background is None else 3), dtype=np.uint8)
+        y0 = 0
+        for strip in self.strips(image, alpha, background):
+            out[y0:y0 + len(strip)] = strip
+            y0 += len(strip)
+        return Image.fromarray(out, 'RGBA' if background is None else 'RGB')
+
+    def write_png(self, f, image, alpha, background=None, compress_level=6,
+                  strategy=zlib.Z_DEFAULT_STRATEGY, executor=None):
+        """
+        Stream the composite into a PNG file object without materializing it
+
+        Rows use the PNG 'Sub' filter, computed per strip with NumPy. Each strip
+        is deflated as an independent, byte-aligned segment primed with the
+        previous strip's tail, so strips can be compressed in parallel on an
+        executor (zlib releases the GIL) and concatenated into one zlib stream.
+
+        Args:
+            f: Binary file object
+            compress_level: zlib level, 0-9
+            strategy: zlib strategy (e.g. zlib.Z_RLE, zlib.Z_FILTERED)
+            executor: Optional concurrent.futures executor for strip compression
+        """
+        width, height = image.size
+        channels = 4 if background is None else 3
+        color_type = 6 if background is None else 2
+
+        f.write(PNG_SIGNATURE)
+        _write_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        _write_chunk(f, b'IDAT', _zlib_header(compress_level))
+
+        # Bounded read-ahead keeps at most a few strips alive at once
+        in_flight = deque()
+        max_in_flight = 2 * getattr(executor, '_max_workers', 1) if executor is not None else 1
+        checksum = 1
+        previous_tail = None
+        strips = self.strips(image, alpha, background)
+        strip = next(strips, None)
+
+        while strip is not None:
+            data = _sub_filter(strip.reshape(len(strip), width * channels), channels)
+            checksum = zlib.adler32(data, checksum)
+            next_strip = next(strips, None)
+
+            args = (data, compress_level, strategy, previous_tail, next_strip is None)
+            if executor is None:
+                _write_chunk(f, b'IDAT', _deflate_segment(*args))
+            else:
+                in_flight.append(executor.submit(_deflate_segment, *args))
+                while len(in_flight) >= max_in_flight:
+                    _write_chunk(f, b'IDAT', in_flight.popleft().result())
+
+            previous_tail = data[-DEFLATE_WINDOW:]
+            strip = next_strip
+
+        while in_flight:
+            _write_chunk(f, b'IDAT', in_flight.popleft().result())
+
+        _write_chunk(f, b'IDAT', struct.pack('>I', checksum & 0xFFFFFFFF))
+        _write_chunk(f, b'IEND', b'')
+
+
+def _sub_filter(flat, channels):
+    """PNG 'Sub' filter rows: each byte minus the same channel of the previous pixel"""
+    rows, row_bytes = flat.shape
+    filtered = np.empty((rows, row_bytes + 1), dtype=np.uint8)
+    filtered[:, 0] = 1
+    filtered[:, 1:channels + 1] = flat[:, :channels]
+    np.subtract(flat[:, channels:], flat[:, :-channels], out=filtered[:, channels + 1:])
+    return filtered.tobytes()
+
+
+def _zlib_header(level):
+    """Two-byte zlib header (32K window, no preset dictionary) for a compression level"""
+    flevel = 0 if level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+    cmf = 0x78
+    flg = flevel << 6
+    flg += 31 - (cmf * 256 + flg) % 31
+    return bytes((cmf, flg))
+
+
+def _deflate_segment(data, level, strategy, dictionary, last):
+    """Raw deflate of one strip, byte-aligned so segments concatenate into one stream"""
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9, strategy, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9, strategy)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def scaled_rows(source, size, y0, y1):
+    """Rows y0:y1 of a PIL image scaled to size, resampling only the matching source band"""
+    width, height = size
+    if source.size == size:
+        return source.crop((0, y0, width, y1))
+
+    scale_y = source.size[1] / float(height)
+    box = (0, y0 * scale_y, source.size[0], y1 * scale_y)
+    return source.resize((width, y1 - y0), Image.BILINEAR, box=box)
+
+
+def _write_chunk(f, chunk_type, data):
+    """Write one length-prefixed, CRC-terminated PNG chunk"""
+    f.write(struct.pack('>I', len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
@@ -0,0 +1,208 @@
+"""
+Output Encoding
+Encoding profiles for processed images (PNG, JPEG, WebP and AVIF). PNG strips
+are deflated in parallel on a thread pool, since zlib releases the GIL, and
+encode time and size are recorded per format and profile. Downscaled
+renditions (thumbnails, previews) are encoded alongside the full result.
+"""
+
+import io
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+try:
+    # Registers AVIF with Pillow versions that lack native support
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+OUTPUT_FORMATS = ('png', 'jpg', 'webp', 'avif')
+
+# Per-format encoder settings for each profile
+ENCODING_PROFILES = {
+    'fast': {
+        'png': {'compress_level': 1, 'strategy': zlib.Z_RLE},
+        'jpg': {'quality': 90},
+        'webp': {'quality': 80, 'method': 0, 'lossless_effort': 0},
+        'avif': {'quality': 60, 'speed': 10},
+    },
+    'balanced': {
+        'png': {'compress_level': 6, 'strategy': zlib.Z_FILTERED},
+        'jpg': {'quality': 95},
+        'webp': {'quality': 90, 'method': 4, 'lossless_effort': 50},
+        'avif': {'quality': 75, 'speed': 6},
+    },
+    'smallest': {
+        'png': {'compress_level': 9, 'strategy': zlib.Z_DEFAULT_STRATEGY},
+        'jpg': {'quality': 85, 'optimize': True, 'progressive': True},
+        'webp': {'quality': 80, 'method': 6, 'lossless_effort': 100},
+        'avif': {'quality': 60, 'speed': 2},
+    },
+}
+
+# Extra renditions of every result: name=format[@longest side]
+DEFAULT_RENDITIONS = 'thumb=webp@320,preview=jpg@1280'
+
+
+def parse_renditions(spec):
+    """
+    Parse a rendition spec such as 'thumb=webp@320,preview=jpg@1280'
+
+    Returns:
+        Dict of name -> (format, longest side in pixels or None for full size)
+    """
+    renditions = {}
+    for entry in spec.split(','):
+        if not entry.strip():
+            continue
+        name, _, target = entry.partition('=')
+        name = name.strip()
+        output_format, _, max_side = target.strip().partition('@')
+        if not name.isalnum():
+            raise ValueError(f"Rendition name '{name}' must be alphanumeric")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Rendition '{name}' format '{output_format}' is not one of {OUTPUT_FORMATS}")
+        renditions[name] = (output_format, int(max_side) if max_side else None)
+    return renditions
+
+
+def avif_supported():
+    """Check if Pillow can write AVIF (natively or through pillow-avif-plugin)"""
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def available_formats():
+    """Output formats this installation can encode"""
+    return tuple(fmt for fmt in OUTPUT_FORMATS if fmt != 'avif' or avif_supported())
+
+
+class ImageEncoder:
+    """Composites and encodes results with a profile, tracking encode cost"""
+
+    def __init__(self, compositor, workers=2, profile='balanced'):
+        """
+        Args:
+            compositor: StripCompositor producing the output strips
+            workers: Threads compressing PNG strips in parallel, and threads encoding renditions
+            profile: Default profile, one of ENCODING_PROFILES
+        """
+        if profile not in ENCODING_PROFILES:
+            raise ValueError(f"Encoding profile '{profile}' is not one of {sorted(ENCODING_PROFILES)}")
+        self.compositor = compositor
+        self.profile = profile
+        self.executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='encoder')
+        # Separate pool: rendition encodes wait on PNG strips from the pool above
+        self.rendition_executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='rendition')
+
+        self._lock = threading.Lock()
+        self._totals = {}  # (format, profile) -> [count, seconds, bytes]
+
+    def encode(self, image, alpha, background=None, output_format='png', profile=None, lossless=False):
+        """
+        Composite and encode one result
+
+        Args:
+            image: Full-resolution PIL RGB foreground
+            alpha: PIL 'L' alpha or a StripMatte (see StripCompositor.strips)
+            background: None (transparent), an RGB tuple or a PIL image
+            output_format: One of OUTPUT_FORMATS
+            profile: Encoding profile (None uses the default)
+            lossless: Lossless WebP instead of lossy
+
+        Returns:
+            (encoded bytes, {'format', 'profile', 'encoded_bytes', 'encode_ms'})
+        """
+        profile = profile or self.profile
+        if profile not in ENCODING_PROFILES:
+            raise ValueError(f"Unknown encoding profile '{profile}'")
+        if output_format not in available_formats():
+            raise ValueError(f"Output format '{output_format}' is not available")
+
+        # JPEG has no alpha channel, so transparency becomes white
+        if background is None and output_format == 'jpg':
+            background = (255, 255, 255)
+
+        settings = ENCODING_PROFILES[profile][output_format]
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+
+        if output_format == 'png':
+            # Composite and encode strip by strip, never holding a full-size copy
+            self.compositor.write_png(buffer, image, alpha, background, executor=self.executor, **settings)
+        else:
+            result = self.compositor.render(image, alpha, background)
+            if output_format == 'jpg':
+                result.save(buffer, 'JPEG', **settings)
+            elif output_format == 'webp':
+                settings = dict(settings)
+                effort = settings.pop('lossless_effort')
+                if lossless:
+                    # For lossless WebP, quality sets the compression effort
+                    settings.update(lossless=True, quality=effort)
+                result.save(buffer, 'WEBP', **settings)
+            else:
+                result.save(buffer, 'AVIF', **settings)
+
+        data = buffer.getvalue()
+        seconds = time.perf_counter() - start
+        self._record(output_format, profile, seconds, len(data))
+
+        return data, {
+            'format': output_format,
+            'profile': profile,
+            'encoded_bytes': len(data),
+            'encode_ms': round(seconds * 1000, 1)
+        }
+
+    def encode_renditions(self, image, alpha, background, renditions, profile=None):
+        """
+        Start encoding downscaled renditions of one result in parallel
+
+        Args:
+            image, alpha, background: As for encode(), at full resolution
+            renditions: Dict of name -> (format, longest side or None), see parse_renditions
+            profile: Encoding profile (None uses the default)
+
+        Returns:
+            Dict of name -> Future resolving to encode()'s (bytes, stats)
+        """
+        return {
+            name: self.rendition_executor.submit(self._encode_rendition, image, alpha, background, output_format,
+                                                 max_side, profile)
+            for name, (output_format, max_side) in renditions.items()
+        }
+
+    def stats(self):
+        """Average encode time and size per format and profile"""
+        with self._lock:
+            return {
+                f"{fmt}/{profile}": {
+                    'count': count,
+                    'avg_encode_ms': round(seconds * 1000 / count, 1),
+                    'avg_bytes': int(total_bytes / count)
+                }
+                for (fmt, profile), (count, seconds, total_bytes) in self._totals.items()
+            }
+
+    def _encode_rendition(self, image, alpha, background, output_format, max_side, profile):
+        """Downscale the foreground and alpha (the compositor scales the background) and encode"""
+        if max_side and max(image.size) > max_side:
+            scale = max_side / float(max(image.size))
+            size = (max(1, int(round(image.width * scale))), max(1, int(round(image.height * scale))))
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+            # A matte computes its rows at the size of the image it is applied to
+            if isinstance(alpha, Image.Image):
+                alpha = alpha.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        return self.encode(image, alpha, background, output_format, profile)
+
+    def _record(self, output_format, profile, seconds, size):
+        with self._lock:
+            totals = self._totals.setdefault((output_format, profile), [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += size
@@ -0,0 +1,325 @@
+"""
+Inference Engines
+Pluggable backends that turn a stacked input batch into U2Net saliency maps.
+Every engine takes normalized (N, 3, H, W) float tensors and returns
+(N, C, H, W) probabilities, one channel per output head it computes, so
+pre/postprocessing is shared by all of them.
+"""
+
+import os
+
+import numpy as np
+import torch
+
+from model.u2net import U2NET, U2NETInference
+from model.fusion import fuse_rebnconv, max_fusion_error
+from services.model_cache import CompiledModelCache
+from services.quantization import load_image_tensors, quantize_model
+
+
+# TorchEngine execution modes
+EXECUTION_MODES = ('default', 'channels_last', 'bf16', 'auto')
+
+
+def cpu_supports_bf16():
+    """Whether this CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+        return 'avx512_bf16' in flags or 'amx_bf16' in flags
+    except OSError:
+        pass
+
+    # Not Linux: ask oneDNN instead
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+class InferenceEngine:
+    """Base class for inference backends"""
+
+    name = None
+
+    def __init__(self, model_path, output_head='d1', num_threads=0, artifact_name=None, build_net=None, **options):
+        """
+        Args:
+            model_path: Path to the .pth weights
+            output_head: Saliency map to compute, 'd1', fused 'd0' or 'all' (both, as channels
+                in U2NETInference.HEADS order)
+            num_threads: Intra-op threads for this engine (0 keeps the backend default)
+            artifact_name: Base name for compiled artifacts (defaults to the weights file name)
+            build_net: Callable returning the untrained network (defaults to U2NET(3, 1))
+            options: Engine-specific settings, unknown ones are ignored
+        """
+        self.model_path = model_path
+        self.output_head = output_head
+        self.num_threads = num_threads
+        self.artifact_name = artifact_name
+        self.build_net = build_net or (lambda: U2NET(3, 1))
+        self.options = options
+
+    def load(self):
+        """Load the model; raise on failure"""
+        raise NotImplementedError
+
+    def predict(self, batch):
+        """Run a (N, 3, H, W) batch and return (N, C, H, W) probabilities on the CPU, one channel per head"""
+        raise NotImplementedError
+
+    def _build_float_model(self, device):
+        """Eager fp32 inference model with the pre-trained weights loaded"""
+        net = self.build_net()
+        net.load_state_dict(torch.load(self.model_path, map_location=device))
+        print("✅ Pre-trained model loaded successfully")
+
+        # Only compute the output head we actually use
+        model = U2NETInference(net, self.output_head)
+        model.to(device)
+        model.eval()
+        return model
+
+
+class TorchEngine(InferenceEngine):
+    """PyTorch engine: eager model with optional BN folding, int8 and a cached TorchScript artifact"""
+
+    name = 'torch'
+
+    # Largest allowed output deviation between the fused and unfused model
+    FUSION_TOLERANCE = 1e-3
+
+    def __init__(self, model_path, output_head='d1', num_threads=0, fuse_batchnorm=True,
+                 precision='fp32', calibration_dir='static/inputs', calibration_images=8,
+                 compile_model=True, execution_mode='default', preprocess=None, **options):
+        """
+        Args:
+            fuse_batchnorm: Fold REBNCONV BatchNorms into their convs at load time
+            precision: 'fp32' or 'int8' (CPU post-training static quantization)
+            calibration_dir: Folder of sample images used to calibrate int8 ranges
+            calibration_images: Maximum number of calibration images
+            compile_model: Use (and build if stale) a frozen TorchScript artifact next to the weights
+            execution_mode: 'default', 'channels_last', 'bf16' (channels_last + CPU bf16 autocast)
+                or 'auto' (channels_last where oneDNN supports it, always fp32; bf16 changes mask
+                values slightly, so it is only used when asked for)
+            preprocess: Callable returning (tensor, image, size) for an image path, used for calibration
+        """
+        super(TorchEngine, self).__init__(model_path, output_head, num_threads, **options)
+        self.fuse_batchnorm = fuse_batchnorm
+        self.precision = precision
+        self.calibration_dir = calibration_dir
+        self.calibration_images = calibration_images
+        self.compile_model = compile_model
+        self.execution_mode = execution_mode
+        self.preprocess = preprocess
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = None
+        self.channels_last = False
+        self.bf16 = False
+
+    def load(self):
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        self.channels_last, self.bf16 = self._resolve_execution_mode()
+
+        # Reuse the compiled artifact if it matches the current weights and settings
+        cache = CompiledModelCache(self.model_path, name=self.artifact_name) if self.compile_model else None
+        if cache is not None:
+            compiled = cache.load(cache.key(self._model_settings()), self.device)
+            if compiled is not None:
+                self.model = compiled
+                print(f"✅ Compiled model loaded, ready on {self.device}")
+                return
+
+        self.model = self._build_float_model(self.device)
+
+        # int8 conversion does its own Conv+BN+ReLU fusion
+        if self.precision == 'int8':
+            self.model = self._quantize_model(self.model)
+        elif self.fuse_batchnorm:
+            self.model = self._fuse_model(self.model)
+
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+        if cache is not None:
+            self.model = self._compile_model(cache, self.model)
+
+        print(f"✅ Model ready on {self.device} ({self.describe_execution_mode()})")
+
+    def predict(self, batch):
+        batch = batch.to(self.device)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+
+        with torch.no_grad(), self._autocast():
+            return self.model(batch).float().cpu()
+
+    def describe_execution_mode(self):
+        """Human-readable name of the active execution mode"""
+        if self.bf16:
+            return 'channels_last + bf16'
+        return 'channels_last' if self.channels_last else 'default'
+
+    def _resolve_execution_mode(self):
+        """
+        Map the requested execution mode onto what this hardware supports
+
+        Returns:
+            (channels_last, bf16) flags; unsupported parts fall back to fp32 defaults
+        """
+        mode = self.execution_mode
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{mode}', expected one of {EXECUTION_MODES}")
+
+        # Quantized kernels pick their own layout and precision
+        if mode == 'default' or self.precision == 'int8':
+            return False, False
+
+        channels_last = self.device.type == 'cuda' or torch.backends.mkldnn.is_available()
+        bf16 = mode == 'bf16' and self.device.type == 'cpu' and cpu_supports_bf16()
+
+        if not channels_last and mode != 'auto':
+            print("⚠️ oneDNN not available, channels_last disabled")
+        if mode == 'bf16' and not bf16:
+            print("⚠️ No native bf16 support on this CPU, using fp32")
+
+        return channels_last, bf16
+
+    def _autocast(self):
+        """CPU bf16 autocast context (a no-op unless bf16 mode is active)"""
+        return torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.bf16)
+
+    def _model_settings(self):
+        """Settings that change the compiled graph, used in the artifact cache key"""
+        settings = [self.device.type, self.output_head, f'fuse={self.fuse_batchnorm}', self.precision,
+                    f'channels_last={self.channels_last}', f'bf16={self.bf16}']
+
+        # int8 ranges depend on the calibration set
+        if self.precision == 'int8' and self.calibration_dir and os.path.isdir(self.calibration_dir):
+            for filename in sorted(os.listdir(self.calibration_dir))[:self.calibration_images]:
+                settings.append(f"{filename}:{os.path.getsize(os.path.join(self.calibration_dir, filename))}")
+
+        return '|'.join(settings)
+
+    def _compile_model(self, cache, model):
+        """
+        Build and save the TorchScript artifact, falling back to the eager model on failure
+
+        Models whose traced graph only runs at the example size (u2net_lite) fail
+        the cache's shape check and stay eager, since input sizes vary per request.
+        """
+        try:
+            print("🔄 Compiling model (first boot with these weights/settings)...")
+            example = torch.rand(1, 3, 320, 320, device=self.device)
+            if self.channels_last:
+                example = example.contiguous(memory_format=torch.channels_last)
+
+            # Tracing under autocast records the bf16 casts in the graph
+            with self._autocast():
+                compiled = cache.compile(model, example, cache.key(self._model_settings()))
+            print("✅ Compiled model saved")
+            return compiled
+        except Exception as e:
+            print(f"⚠️ Could not compile model, using eager mode: {e}")
+            return model
+
+    def _fuse_model(self, model):
+        """Fold Conv+BN in every RSU stage, keeping the unfused model if outputs diverge"""
+        fused = fuse_rebnconv(model)
+        error = max_fusion_error(model, fused)
+
+        if error > self.FUSION_TOLERANCE:
+            print(f"⚠️ Conv+BN fusion changed outputs by {error:.2e}, using unfused model")
+            return model
+
+        print(f"✅ Conv+BN layers folded (max deviation {error:.2e})")
+        return fused
+
+    def _quantize_model(self, model):
+        """Convert the model to int8, keeping fp32 if that is not possible"""
+        if self.device.type != 'cpu':
+            print("⚠️ int8 inference is CPU-only, using fp32")
+            self.precision = 'fp32'
+            return model
+
+        calibration = []
+        if self.preprocess is not None:
+            calibration = load_image_tensors(self.calibration_dir, self.preprocess, self.calibration_images)
+        if not calibration:
+            print(f"⚠️ No calibration images in {self.calibration_dir}, using fp32")
+            self.precision = 'fp32'
+            return model
+
+        print(f"🔄 Quantizing model to int8 ({len(calibration)} calibration images)...")
+        quantized = quantize_model(model, calibration)
+        print("✅ int8 model ready")
+        return quantized
+
+
+class OnnxRuntimeEngine(InferenceEngine):
+    """ONNX Runtime CPU engine using a graph exported from model/u2net.py"""
+
+    name = 'onnxruntime'
+
+    SUFFIX = '.onnx'
+    OPSET_VERSION = 17
+
+    def __init__(self, model_path, output_head='d1', num_threads=0, **options):
+        super(OnnxRuntimeEngine, self).__init__(model_path, output_head, num_threads, **options)
+        self.session = None
+        self.input_name = None
+
+    def load(self):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise Exception("onnxruntime is not installed. Run: pip install onnxruntime")
+
+        # ORT applies its own Conv+BN and activation fusions, so export the plain fp32 graph
+        cache = CompiledModelCache(self.model_path, suffix=self.SUFFIX, name=self.artifact_name)
+        key = cache.key(f'onnx|opset={self.OPSET_VERSION}|{self.output_head}')
+        path = cache.artifact_path(key)
+        if not os.path.exists(path):
+            self._export(path)
+            cache.remove_stale(keep=path)
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            session_options.intra_op_num_threads = self.num_threads
+
+        self.session = ort.InferenceSession(path, session_options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        print("✅ ONNX Runtime model ready on cpu")
+
+    def predict(self, batch):
+        inputs = np.ascontiguousarray(batch.cpu().numpy(), dtype=np.float32)
+        output = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(output)
+
+    def _export(self, path):
+        """Export the fp32 inference model with dynamic batch and spatial axes"""
+        print("🔄 Exporting model to ONNX (first boot with these weights)...")
+        model = self._build_float_model(torch.device('cpu'))
+        example = torch.rand(1, 3, 320, 320)
+        dynamic_axes = {name: {0: 'batch', 2: 'height', 3: 'width'} for name in ('input', 'mask')}
+
+        tmp_path = path + '.tmp'
+        with torch.no_grad():
+            torch.onnx.export(model, example, tmp_path, input_names=['input'], output_names=['mask'],
+                              dynamic_axes=dynamic_axes, opset_version=self.OPSET_VERSION)
+        os.replace(tmp_path, path)
+        print("✅ ONNX model saved")
+
+
+# Engines selectable via INFERENCE_ENGINE
+ENGINES = {engine.name: engine for engine in (TorchEngine, OnnxRuntimeEngine)}
+
+
+def create_engine(name, model_path, **options):
+    """Instantiate an engine by name"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown inference engine '{name}', expected one of {sorted(ENGINES)}")
+    return ENGINES[name](model_path, **options)
@@ -0,0 +1,194 @@
+"""
+Gallery Index
+In-memory index of processed images, sorted by creation time. It is built
+from one directory scan at startup and then kept current from FileStore
+write/delete events, so a gallery page costs a binary search plus the page
+itself instead of a listdir and a stat per file. Renditions of a result
+(<stem>.<rendition>.<ext>, e.g. thumbnails) are attached to it rather than
+listed as images of their own.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+
+class GalleryIndex:
+    """Processed images sorted by creation time, with cursor pagination"""
+
+    def __init__(self, folder, extensions):
+        """
+        Args:
+            folder: Directory of processed images to index
+            extensions: File extensions that count as images
+        """
+        self.folder = os.path.normpath(folder)
+        self.extensions = {ext.lower() for ext in extensions}
+
+        self._lock = threading.Lock()
+        self._entries = {}  # filename -> (created, size)
+        self._keys = {None: []}  # format (None = any) -> sorted [(created, filename)]
+        self._renditions = {}  # result stem -> {rendition name: filename}
+
+        self.rebuild()
+
+    def rebuild(self):
+        """Index the folder from scratch (one scan, at startup)"""
+        entries = {}
+        renditions = {}
+        if os.path.isdir(self.folder):
+            with os.scandir(self.folder) as scan:
+                for item in scan:
+                    if not item.is_file() or not self._format(item.name):
+                        continue
+                    rendition = _split_rendition(item.name)
+                    if rendition:
+                        renditions.setdefault(rendition[0], {})[rendition[1]] = item.name
+                        continue
+                    stat = item.stat()
+                    entries[item.name] = (stat.st_ctime, stat.st_size)
+
+        keys = {None: []}
+        for filename, (created, _) in entries.items():
+            keys[None].append((created, filename))
+            keys.setdefault(self._format(filename), []).append((created, filename))
+        for ordered in keys.values():
+            ordered.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._renditions = renditions
+
+    def add(self, filename, size, created=None):
+        """Index a new or overwritten image"""
+        image_format = self._format(filename)
+        if not image_format:
+            return
+        created = time.time() if created is None else created
+
+        rendition = _split_rendition(filename)
+        with self._lock:
+            if rendition:
+                self._renditions.setdefault(rendition[0], {})[rendition[1]] = filename
+                return
+
+            self._discard(filename)
+            self._entries[filename] = (created, size)
+            # New results are the newest, so this is nearly always an append
+            bisect.insort(self._keys[None], (created, filename))
+            bisect.insort(self._keys.setdefault(image_format, []), (created, filename))
+
+    def remove(self, filename):
+        """Drop an image (or one of its renditions) from the index; returns whether it was indexed"""
+        rendition = _split_rendition(filename)
+        with self._lock:
+            if rendition:
+                names = self._renditions.get(rendition[0], {})
+                existed = names.pop(rendition[1], None) is not None
+                if not names:
+                    self._renditions.pop(rendition[0], None)
+                return existed
+            return self._discard(filename)
+
+    def renditions(self, filename):
+        """Renditions of a result, as {rendition name: filename}"""
+        with self._lock:
+            return dict(self._renditions.get(filename.rsplit('.', 1)[0], {}))
+
+    def observe(self, event, path, size):
+        """FileStore listener: index writes and deletes inside the folder"""
+        if os.path.dirname(os.path.normpath(path)) != self.folder:
+            return
+        filename = os.path.basename(path)
+        if event == 'write':
+            self.add(filename, size)
+        elif event == 'delete':
+            self.remove(filename)
+
+    def page(self, cursor=None, limit=50, since=None, until=None, image_format=None):
+        """
+        One page of images, newest first
+
+        Args:
+            cursor: next_cursor of the previous page (None for the first page)
+            limit: Images per page
+            since: Only images created at or after this timestamp
+            until: Only images created before this timestamp
+            image_format: Only images of this format (e.g. 'png', 'jpg')
+
+        Returns:
+            (list of (filename, created, size, {rendition name: filename}), next_cursor or None on the last page)
+
+        Raises:
+            ValueError: if the cursor is malformed
+        """
+        with self._lock:
+            keys = self._keys.get(self._normalize(image_format) if image_format else None, [])
+
+            end = len(keys)
+            if cursor:
+                end = bisect.bisect_left(keys, _parse_cursor(cursor))
+            if until is not None:
+                end = min(end, bisect.bisect_left(keys, (until,)))
+            start = bisect.bisect_left(keys, (since,)) if since is not None else 0
+
+            first = max(start, end - max(1, int(limit)))
+            selected = keys[first:end]
+            page = [(filename, created, self._entries[filename][1],
+                     dict(self._renditions.get(filename.rsplit('.', 1)[0], {})))
+                    for created, filename in reversed(selected)]
+
+        next_cursor = _format_cursor(selected[0]) if selected and first > start else None
+        return page, next_cursor
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _discard(self, filename):
+        """Remove an entry and its sort keys (caller holds the lock)"""
+        entry = self._entries.pop(filename, None)
+        if entry is None:
+            return False
+        key = (entry[0], filename)
+        for image_format in (None, self._format(filename)):
+            keys = self._keys.get(image_format, [])
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        return True
+
+    def _format(self, filename):
+        """Normalized format of an image filename, or None if it isn't an image"""
+        if '.' not in filename:
+            return None
+        ext = filename.rsplit('.', 1)[1].lower()
+        return self._normalize(ext) if ext in self.extensions else None
+
+    @staticmethod
+    def _normalize(image_format):
+        image_format = image_format.lower()
+        return 'jpg' if image_format == 'jpeg' else image_format
+
+
+def _split_rendition(filename):
+    """(result stem, rendition name) for '<stem>.<rendition>.<ext>', else None"""
+    parts = filename.split('.')
+    if len(parts) == 3 and parts[0] and parts[1].isalnum():
+        return parts[0], parts[1]
+    return None
+
+
+def _format_cursor(key):
+    """Opaque cursor for a (created, filename) key; repr keeps the timestamp exact"""
+    created, filename = key
+    return f"{created!r}:{filename}"
+
+
+def _parse_cursor(cursor):
+    created, separator, filename = cursor.partition(':')
+    if not separator or not filename:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return float(created), filename
@@ -3,16 +3,30 @@ Image Processor Service
 Handles image manipulation operations like background changes, filters, etc.
 """
 
+import io
 import os
 from PIL import Image, ImageEnhance, ImageFilter
 import numpy as np
+from services.compositor import StripCompositor
+from services.encoding import ImageEncoder
+from services.matting import load_matte
 
 class ImageProcessor:
     """Service for additional image processing operations"""
     
-    def __init__(self):
-        """Initialize image processor"""
-        pass
+    def __init__(self, storage=None, encoder=None, renditions=None):
+        """
+        Initialize image processor
+        
+        Args:
+            storage: FileStore used to read uploads/masks and write results (None uses the disk directly)
+            encoder: ImageEncoder for recomposited results (defaults to a 'fast' profile encoder)
+            renditions: Dict of name -> (format, longest side) encoded alongside each recomposited
+                result, as for BackgroundRemoverService (None or empty for none)
+        """
+        self.storage = storage
+        self.encoder = encoder if encoder is not None else ImageEncoder(StripCompositor(), profile='fast')
+        self.renditions = renditions or {}
     
     def change_background(self, image_path, background_type, background_value):
         """
@@ -39,13 +53,91 @@ class ImageProcessor:
             # Save
             filename = os.path.basename(image_path).replace('.png', f'_bg_{background_type}.png')
             output_path = os.path.join('static/processed', filename)
-            result.save(output_path, 'PNG')
+            buffer = io.BytesIO()
+            result.save(buffer, 'PNG')
+            self._write(output_path, buffer.getvalue())
+            
+            return filename
+            
+        except Exception as e:
+            raise Exception(f"Error changing background: {str(e)}")
+    
+    def recomposite(self, original_path, mask_path, background_type, background_value, output_format='png',
+                    encoding_profile=None, report=None):
+        """
+        Render an upload on a new background from its stored alpha mask, without the model
+        
+        Args:
+            original_path: Path to the original upload
+            mask_path: Path to the alpha mask saved when the upload was processed
+            background_type: 'transparent', 'color', 'image', or 'gradient'
+            background_value: Color hex, image path, or gradient config
+            output_format: 'png', 'jpg', 'webp' or 'avif'
+            encoding_profile: 'fast', 'balanced' or 'smallest' (encoder default if omitted)
+            report: Optional dict filled with encode stats, plus 'renditions': name -> the
+                rendition's stats and filename
+        
+        Returns:
+            Filename of the new image
+        """
+        try:
+            image = Image.open(self._open(original_path)).convert('RGB')
+            alpha = load_matte(self._open(mask_path))
+            
+            if background_type == 'transparent':
+                background = None
+                suffix = 'transparent'
+            elif background_type == 'color':
+                background = self._hex_to_rgb(background_value)
+                # Named from the parsed color, never the raw request text
+                suffix = '%02x%02x%02x' % background
+            else:
+                background = self._create_background(image.size, background_type, background_value)
+                # Unknown types fall back to white in _create_background
+                suffix = background_type if background_type in ('image', 'gradient') else 'ffffff'
+            
+            # Encode the result, with its renditions in parallel
+            renditions = self.encoder.encode_renditions(image, alpha, background, self.renditions,
+                                                        encoding_profile)
+            data, stats = self.encoder.encode(image, alpha, background, output_format, encoding_profile)
+            if report is not None:
+                report.update(stats)
+            
+            # Save
+            stem = os.path.splitext(os.path.basename(original_path))[0] + f'_bg_{suffix}'
+            filename = f'{stem}.{output_format}'
+            self._write(os.path.join('static/processed', filename), data)
+            
+            # Renditions go next to it as <stem>.<rendition>.<format>, like processed results
+            for name, future in renditions.items():
+                rendition_data, rendition_stats = future.result()
+                rendition_filename = f"{stem}.{name}.{rendition_stats['format']}"
+                self._write(os.path.join('static/processed', rendition_filename), rendition_data)
+                if report is not None:
+                    report.setdefault('renditions', {})[name] = dict(rendition_stats, filename=rendition_filename)
             
             return filename
             
         except Exception as e:
             raise Exception(f"Error changing background: {str(e)}")
     
+    def _open(self, path):
+        """File object (or path) to read, preferring the in-memory store"""
+        if self.storage is None:
+            return path
+        data = self.storage.open(path)
+        if data is None:
+            raise Exception(f"File not found: {os.path.basename(path)}")
+        return data
+    
+    def _write(self, path, data):
+        """Write encoded bytes through the store's background writer, or straight to disk"""
+        if self.storage is None:
+            with open(path, 'wb') as f:
+                f.write(data)
+            return
+        self.storage.write(path, data)
+    
     def _create_background(self, size, bg_type, bg_value):
         """Create background based on type"""
         
@@ -78,15 +170,12 @@ class ImageProcessor:
         color1 = self._hex_to_rgb(config.get('color1', '#667eea'))
         color2 = self._hex_to_rgb(config.get('color2', '#764ba2'))
         
-        # Create gradient
-        gradient = np.zeros((size[1], size[0], 4), dtype=np.uint8)
-        
-        for i in range(size[1]):
-            ratio = i / size[1]
-            r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-            g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-            b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-            gradient[i, :] = [r, g, b, 255]
+        # Create gradient: one interpolated row per line, broadcast across the width
+        ratio = (np.arange(size[1]) / size[1])[:, None]
+        rows = np.array(color1) * (1 - ratio) + np.array(color2) * ratio
+        gradient = np.empty((size[1], size[0], 4), dtype=np.uint8)
+        gradient[..., :3] = rows.astype(np.uint8)[:, None, :]
+        gradient[..., 3] = 255
         
         return Image.fromarray(gradient, 'RGBA')
     
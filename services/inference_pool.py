@@ -0,0 +1,201 @@
+"""
+Inference Process Pool
+Runs a model in dedicated worker processes, each loading it once, so forward
+passes run outside the web process and its GIL. Input and output tensors are
+exchanged through per-worker shared-memory buffers; only shapes and buffer
+names go over the pipe, never pickled tensors.
+"""
+
+import math
+import multiprocessing
+import os
+import queue
+import weakref
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+# Engine options that can't cross a process boundary; workers rebuild them
+LOCAL_OPTIONS = ('build_net', 'preprocess')
+
+
+class InferencePool:
+    """Engine-compatible front end for a pool of model worker processes"""
+
+    def __init__(self, engine_name, model_path, variant, processes=2, input_size=320, **options):
+        """
+        Args:
+            engine_name: Engine each worker loads, 'torch' or 'onnxruntime'
+            model_path: Path to the weights
+            variant: Model variant (key of MODEL_VARIANTS) the workers build
+            processes: Worker processes, each holding its own copy of the model
+            input_size: Image size used to preprocess int8 calibration images
+            options: Engine options (see create_engine); num_threads=0 splits the
+                CPU cores evenly between the workers
+        """
+        self.engine_name = engine_name
+        self.model_path = model_path
+        self.variant = variant
+        self.processes = max(1, int(processes))
+        self.input_size = input_size
+        self.options = {name: value for name, value in options.items() if name not in LOCAL_OPTIONS}
+        if not self.options.get('num_threads'):
+            self.options['num_threads'] = max(1, (os.cpu_count() or 1) // self.processes)
+
+        self._workers = []
+        self._idle = queue.Queue()
+
+    def load(self):
+        """Start the workers and wait until each has loaded the model; raise on failure"""
+        # Forking a process that already runs torch threads can deadlock, so always spawn
+        context = multiprocessing.get_context('spawn')
+        preprocess = partial(calibration_tensor, size=self.input_size)
+
+        try:
+            # The first worker builds any missing compiled artifacts; the rest then load them concurrently
+            for i in range(self.processes):
+                self._workers.append(_Worker(context, self.engine_name, self.model_path, self.variant,
+                                             dict(self.options, preprocess=preprocess)))
+                if i == 0:
+                    self._workers[0].wait_ready()
+            for worker in self._workers[1:]:
+                worker.wait_ready()
+        except Exception:
+            _shutdown(self._workers)
+            raise
+
+        for worker in self._workers:
+            self._idle.put(worker)
+        # Stop the processes once an evicted model's last in-flight batch lets go of the pool
+        weakref.finalize(self, _shutdown, list(self._workers))
+        print(f"✅ {self.processes} inference worker processes ready ({self.options['num_threads']} threads each)")
+
+    def predict(self, batch):
+        """Run a (N, 3, H, W) batch on the next idle worker and return (N, C, H, W) probabilities"""
+        worker = self._idle.get()
+        try:
+            return worker.predict(batch)
+        finally:
+            self._idle.put(worker)
+
+
+class _Worker:
+    """Parent-side handle of one worker process and its shared-memory buffers"""
+
+    def __init__(self, context, engine_name, model_path, variant, options):
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, engine_name, model_path, variant,
+                                                                  options),
+                                       name=f'inference-{variant}', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.inputs = None
+        self.outputs = None
+
+    def wait_ready(self):
+        status, payload = self._conn.recv()
+        if status != 'ready':
+            raise Exception(f"Inference worker failed to load the model: {payload}")
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch.cpu().numpy(), dtype=np.float32)
+        self._reserve(batch.nbytes)
+        np.ndarray(batch.shape, np.float32, buffer=self.inputs.buf)[:] = batch
+
+        self._conn.send((self.inputs.name, self.outputs.name, batch.shape))
+        status, payload = self._conn.recv()
+        if status != 'ok':
+            raise Exception(f"Inference worker error: {payload}")
+
+        # Copy out before the buffer is reused by the next batch
+        return torch.from_numpy(np.ndarray(payload, np.float32, buffer=self.outputs.buf).copy())
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        for block in (self.inputs, self.outputs):
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    def _reserve(self, input_bytes):
+        """Grow the shared buffers (in 1 MB steps) if a batch doesn't fit; outputs have at most two channels"""
+        if self.inputs is not None and self.inputs.size >= input_bytes:
+            return
+        size = int(math.ceil(input_bytes / float(1 << 20))) << 20
+        for block in (self.inputs, self.outputs):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self.inputs = shared_memory.SharedMemory(create=True, size=size)
+        self.outputs = shared_memory.SharedMemory(create=True, size=size * 2 // 3 + 1)
+
+
+def _shutdown(workers):
+    for worker in workers:
+        worker.close()
+
+
+def _worker_main(conn, engine_name, model_path, variant, options):
+    """Worker process: load the model once, then serve batches from shared memory"""
+    from services.engines import create_engine
+    from services.model_registry import MODEL_VARIANTS
+
+    try:
+        engine = create_engine(engine_name, model_path, build_net=MODEL_VARIANTS[variant][0], **options)
+        engine.load()
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    conn.send(('ready', None))
+
+    blocks = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        input_name, output_name, shape = message
+        try:
+            # Drop buffers the parent has replaced with larger ones
+            for name in [name for name in blocks if name not in (input_name, output_name)]:
+                blocks.pop(name).close()
+            for name in (input_name, output_name):
+                if name not in blocks:
+                    # Spawned workers share the parent's resource tracker; the parent unlinks
+                    blocks[name] = shared_memory.SharedMemory(name=name)
+
+            batch = torch.from_numpy(np.ndarray(shape, np.float32, buffer=blocks[input_name].buf))
+            output = engine.predict(batch).numpy()
+            np.ndarray(output.shape, np.float32, buffer=blocks[output_name].buf)[:] = output
+            conn.send(('ok', output.shape))
+        except Exception as e:
+            conn.send(('error', str(e)))
+        finally:
+            # Views must be gone before a block can be closed
+            batch = output = None
+
+    for block in blocks.values():
+        block.close()
+
+
+def calibration_tensor(image_path, size=320):
+    """Model input for an int8 calibration image, matching the service preprocessing"""
+    image = Image.open(image_path).convert('RGB').resize((size, size), Image.BILINEAR)
+    transform = transforms.Compose([
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+    return transform(image).unsqueeze(0), image, image.size
@@ -0,0 +1,178 @@
+"""
+Job Queue
+Runs background removal jobs on a dedicated executor behind a bounded queue,
+so web threads only submit and poll. Jobs report progress and a full queue
+rejects new work instead of letting it pile up.
+"""
+
+import math
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super(QueueFull, self).__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """State of one submitted job"""
+
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.progress = 0
+        self.stage = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.version = 0  # bumped on every change, for event streams
+        self._cond = threading.Condition()
+
+    def update(self, progress=None, stage=None, status=None, result=None, error=None):
+        """Record a change and wake up anyone waiting on this job"""
+        with self._cond:
+            if progress is not None:
+                self.progress = progress
+            if stage is not None:
+                self.stage = stage
+            if status is not None:
+                self.status = status
+            if result is not None:
+                self.result = result
+            if error is not None:
+                self.error = error
+            self.updated = time.time()
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job changes past version (or timeout); returns the current version"""
+        with self._cond:
+            if self.version == version and not self.finished:
+                self._cond.wait(timeout)
+            return self.version
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        """Public status of the job"""
+        with self._cond:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'progress': self.progress,
+                'stage': self.stage,
+                'error': self.error,
+                'created': self.created,
+                'updated': self.updated
+            }
+
+
+class JobQueue:
+    """Bounded queue of jobs processed by dedicated worker threads"""
+
+    def __init__(self, process, workers=1, max_queued=16, ttl_seconds=3600):
+        """
+        Args:
+            process: Callable taking (payload, progress) and returning the job result;
+                progress(percent, stage) reports intermediate progress
+            workers: Worker threads running jobs
+            max_queued: Jobs waiting beyond the running ones before submissions get rejected
+            ttl_seconds: How long finished jobs stay queryable
+        """
+        self.process = process
+        self.workers = max(1, int(workers))
+        self.ttl = ttl_seconds
+
+        self._queue = queue.Queue(maxsize=max(1, int(max_queued)))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._job_seconds = 0.0
+
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+
+    def submit(self, payload):
+        """
+        Queue a job
+
+        Raises:
+            QueueFull: if the queue is at capacity
+        """
+        self._purge()
+        job = Job(payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull(self.retry_after())
+        return job
+
+    def get(self, job_id):
+        """Job by id, or None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up"""
+        with self._lock:
+            average = self._job_seconds / self._completed if self._completed else 5.0
+        # A slot frees up whenever a running job finishes and the next one starts
+        return max(1, int(math.ceil(average / self.workers)))
+
+    def stats(self):
+        """Queue depth and throughput counters"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'running': self._running,
+                'capacity': self._queue.maxsize,
+                'workers': self.workers,
+                'completed': self._completed,
+                'avg_job_seconds': round(self._job_seconds / self._completed, 3) if self._completed else None
+            }
+
+    def _run(self):
+        """Worker loop"""
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            start = time.perf_counter()
+            job.update(status='running', stage='starting')
+            try:
+                result = self.process(job.payload, lambda progress, stage: job.update(progress, stage))
+                job.payload = None  # release the upload bytes
+                job.update(progress=100, stage='done', status='done', result=result)
+            except Exception as e:
+                job.payload = None
+                job.update(stage='failed', status='failed', error=str(e))
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._job_seconds += time.perf_counter() - start
+                self._queue.task_done()
+
+    def _purge(self):
+        """Forget finished jobs older than the TTL"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
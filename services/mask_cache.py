@@ -0,0 +1,264 @@
+"""
+Mask Cache
+Content-addressed cache of predicted masks, keyed by the uploaded bytes and the
+model settings. Masks live in an in-memory LRU tier backed by a size-bounded
+on-disk tier, and identical concurrent requests share a single inference.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+
+class MaskCache:
+    """Two-tier (memory, disk) LRU cache of uint8 masks with single-flight computation"""
+
+    def __init__(self, memory_mb=64, disk_dir='static/cache/masks', disk_mb=512):
+        """
+        Args:
+            memory_mb: Combined size of masks kept in memory (0 disables the memory tier)
+            disk_dir: Folder for the on-disk tier (None or empty disables it)
+            disk_mb: Combined size of mask files on disk before the oldest are removed
+        """
+        self.memory_budget = int(memory_mb * 1024 * 1024)
+        self.disk_dir = disk_dir or None
+        self.disk_budget = int(disk_mb * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> mask, least recently used first
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._inflight = {}  # key -> Future of the mask being computed
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._index_disk()
+
+    @staticmethod
+    def key(content_digest, *settings):
+        """Cache key for an upload's content digest and the settings that shape its mask"""
+        digest = hashlib.sha256(content_digest.encode('utf-8'))
+        for part in settings:
+            digest.update(b'\0')
+            digest.update(str(part).encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached mask for key, or compute it once
+
+        Concurrent callers with the same key wait for the first caller's result
+        instead of running their own inference.
+
+        Args:
+            key: Cache key from key()
+            compute: Callable returning a 2D uint8 mask
+
+        Returns:
+            Read-only 2D uint8 mask
+        """
+        mask = self.get(key)
+        if mask is not None:
+            return mask
+
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+
+        try:
+            mask = compute()
+        except BaseException as e:
+            self.settle(key, future, error=e)
+            raise
+        return self.settle(key, future, mask)
+
+    def claim(self, key):
+        """
+        Become the caller that computes key, or join the caller already computing it
+
+        Callers that compute several masks together (batches) claim each key
+        first, so only the leader of a key runs inference for it.
+
+        Returns:
+            (future, leader): the leader must pass its result to settle(); other
+            callers wait on the future, which also resolves right away if the
+            mask was stored meanwhile
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters['coalesced'] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+
+        # Another leader may have finished between the caller's lookup and registering
+        mask = self._lookup(key, count=False)
+        if mask is not None:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(mask)
+            return future, False
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return future, True
+
+    def settle(self, key, future, mask=None, error=None):
+        """
+        Store a claimed key's mask (or the error computing it) and release its waiters
+
+        Returns:
+            The stored read-only mask, or None when settling an error
+        """
+        if error is None:
+            try:
+                mask = self.put(key, mask)
+            except Exception as e:
+                self.settle(key, future, error=e)
+                raise
+        with self._lock:
+            self._inflight.pop(key, None)
+
+        if error is not None:
+            future.set_exception(error)
+            return None
+        future.set_result(mask)
+        return mask
+
+    def get(self, key):
+        """Cached mask for key from memory or disk, or None"""
+        return self._lookup(key, count=True)
+
+    def put(self, key, mask):
+        """Store a mask in both tiers and return it as a read-only array"""
+        mask = np.ascontiguousarray(mask, dtype=np.uint8)
+        mask.flags.writeable = False
+        self._remember(key, mask)
+
+        if self.disk_dir:
+            path = self._path(key)
+            tmp_path = None
+            try:
+                # Unique temp name: concurrent puts of the same key must not write one file
+                fd, tmp_path = tempfile.mkstemp(prefix=f"{key}.", suffix='.tmp', dir=self.disk_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    Image.fromarray(mask, 'L').save(f, 'PNG', compress_level=1)
+                os.replace(tmp_path, path)
+                tmp_path = None
+                self._add_disk_entry(key, os.path.getsize(path))
+            except OSError as e:
+                print(f"⚠️ Could not write cached mask {path}: {e}")
+            finally:
+                if tmp_path is not None:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+        return mask
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update({
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+            })
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def _lookup(self, key, count):
+        """Memory then disk lookup; disk hits are promoted to memory"""
+        with self._lock:
+            mask = self._memory.get(key)
+            if mask is not None:
+                self._memory.move_to_end(key)
+                if count:
+                    self.counters['memory_hits'] += 1
+                return mask
+            on_disk = key in self._disk
+
+        if not on_disk:
+            return None
+
+        path = self._path(key)
+        try:
+            with Image.open(path) as image:
+                mask = np.array(image.convert('L'))
+            os.utime(path)
+        except OSError:
+            self._drop_disk_entry(key)
+            return None
+
+        mask.flags.writeable = False
+        self._remember(key, mask)
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            if count:
+                self.counters['disk_hits'] += 1
+        return mask
+
+    def _remember(self, key, mask):
+        """Add a mask to the memory tier, evicting least recently used masks"""
+        if not self.memory_budget or mask.nbytes > self.memory_budget:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous.nbytes
+            self._memory[key] = mask
+            self._memory_bytes += mask.nbytes
+
+            while self._memory_bytes > self.memory_budget:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.png")
+
+    def _index_disk(self):
+        """Rebuild the disk index from existing files, oldest first"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _add_disk_entry(self, key, size):
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._evict_disk()
+
+    def _drop_disk_entry(self, key):
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _evict_disk(self):
+        """Remove the least recently used mask files until the disk budget is met (caller holds the lock)"""
+        while self._disk and self._disk_bytes > self.disk_budget:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -0,0 +1,182 @@
+"""
+Alpha Matting
+Turns the model's probability mask into an alpha channel. Besides the hard
+threshold, a fast guided filter driven by the original image recovers soft
+edges (hair, fur) using only box filters, so cost is linear in pixel count.
+
+StripMatte keeps the mask at model resolution and computes the full-size
+alpha one strip of rows at a time as the compositor asks for it.
+"""
+
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+from services.compositor import scaled_rows
+
+# 'binary': hard threshold at 128, 'soft': raw probabilities, 'guided': guided-filter matte
+ALPHA_MODES = ('binary', 'soft', 'guided')
+
+
+def _box(x, radius):
+    """Normalized box filter of size (2r+1)^2"""
+    return cv2.boxFilter(x, -1, (2 * radius + 1, 2 * radius + 1), borderType=cv2.BORDER_REFLECT)
+
+
+def guided_filter(guide, src, radius, eps=1e-3, subsample=1):
+    """
+    Fast guided filter (He et al.) with a grayscale guide
+
+    The per-window linear coefficients are computed on a subsampled grid and
+    upsampled, then applied to the full-resolution guide.
+
+    Args:
+        guide: 2D float32 guide image in [0, 1]
+        src: 2D float32 image to filter in [0, 1]
+        radius: Window radius at full resolution
+        eps: Regularization; larger values smooth more
+        subsample: Downscale factor for computing the coefficients
+
+    Returns:
+        Filtered float32 image at full resolution
+    """
+    height, width = guide.shape
+    if subsample > 1:
+        small = (max(1, width // subsample), max(1, height // subsample))
+        guide_small = cv2.resize(guide, small, interpolation=cv2.INTER_AREA)
+        src_small = cv2.resize(src, small, interpolation=cv2.INTER_AREA)
+        radius = max(1, radius // subsample)
+    else:
+        guide_small, src_small = guide, src
+
+    mean_i = _box(guide_small, radius)
+    mean_p = _box(src_small, radius)
+    cov_ip = _box(guide_small * src_small, radius) - mean_i * mean_p
+    var_i = _box(guide_small * guide_small, radius) - mean_i * mean_i
+
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    mean_a = _box(a, radius)
+    mean_b = _box(b, radius)
+
+    if subsample > 1:
+        mean_a = cv2.resize(mean_a, (width, height), interpolation=cv2.INTER_LINEAR)
+        mean_b = cv2.resize(mean_b, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    return mean_a * guide + mean_b
+
+
+def guided_params(size):
+    """(radius, subsample) of the guided filter for an image of this (width, height)"""
+    longest = max(size)
+    return max(2, int(round(longest / 200.0))), max(1, longest // 1024)
+
+
+def guided_alpha(image, mask, eps=1e-3, low=0.05, high=0.95, radius=None, subsample=None):
+    """
+    Soft alpha matte from the probability mask, guided by the original image
+
+    Args:
+        image: HxW uint8 luminance or HxWx3 uint8 RGB array
+        mask: HxW uint8 probability mask (0-255)
+        low, high: Alpha below/above these becomes fully transparent/opaque
+        radius, subsample: Filter settings (default: guided_params of the mask size), so
+            a strip of a larger image can be filtered with that image's settings
+
+    Returns:
+        HxW uint8 alpha
+    """
+    if radius is None or subsample is None:
+        radius, subsample = guided_params(mask.shape[::-1])
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    guide = image.astype(np.float32) / 255.0
+    alpha = guided_filter(guide, mask.astype(np.float32) / 255.0, radius, eps, subsample)
+
+    # Stretch so confident regions are fully opaque/transparent and only edges stay soft
+    alpha = (alpha - low) * (1.0 / (high - low))
+    return (np.clip(alpha, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def compute_alpha(image, mask, mode='binary'):
+    """
+    Alpha channel for a probability mask
+
+    Args:
+        image: HxW uint8 luminance or HxWx3 uint8 RGB array (the guide; unused unless 'guided')
+        mask: HxW uint8 probability mask (0-255)
+        mode: One of ALPHA_MODES
+    """
+    if mode == 'binary':
+        # Values above 128 are considered foreground
+        return np.where(mask > 128, 255, 0).astype(np.uint8)
+    if mode == 'soft':
+        return mask
+    if mode == 'guided':
+        return guided_alpha(image, mask)
+    raise ValueError(f"Unknown alpha mode '{mode}', expected one of {ALPHA_MODES}")
+
+
+class StripMatte:
+    """Alpha channel of any size, computed strip by strip from a probability mask"""
+
+    def __init__(self, mask, mode='binary'):
+        """
+        Args:
+            mask: 2D uint8 array or PIL 'L' probability mask, usually at model resolution
+            mode: One of ALPHA_MODES
+        """
+        if mode not in ALPHA_MODES:
+            raise ValueError(f"Unknown alpha mode '{mode}', expected one of {ALPHA_MODES}")
+        self.mask = mask if isinstance(mask, Image.Image) else Image.fromarray(mask, 'L')
+        self.mode = mode
+
+    def rows(self, image, y0, y1):
+        """
+        Alpha for rows y0:y1 of the image being composited
+
+        The mask is upsampled to the image one band at a time. The guided
+        filter also reads the rows its windows reach beyond the strip, so
+        strips join without seams and no full-size float buffers exist.
+
+        Args:
+            image: PIL RGB foreground the alpha is applied to (the guide for 'guided')
+
+        Returns:
+            (y1 - y0, width) uint8 alpha
+        """
+        if self.mode != 'guided':
+            return compute_alpha(None, np.asarray(scaled_rows(self.mask, image.size, y0, y1)), self.mode)
+
+        width, height = image.size
+        radius, subsample = guided_params(image.size)
+        # Two box passes reach 2 * radius rows; the subsampled grid blurs by up to another cell
+        overlap = 2 * radius + 2 * subsample
+        top, bottom = max(0, y0 - overlap), min(height, y1 + overlap)
+        guide = np.asarray(image.crop((0, top, width, bottom)).convert('L'))
+        mask = np.asarray(scaled_rows(self.mask, image.size, top, bottom))
+        return guided_alpha(guide, mask, radius=radius, subsample=subsample)[y0 - top:y1 - top]
+
+    def encode(self):
+        """PNG bytes of the mask with the alpha mode, for load_matte"""
+        info = PngImagePlugin.PngInfo()
+        info.add_text('alpha_mode', self.mode)
+        buffer = io.BytesIO()
+        self.mask.save(buffer, 'PNG', pnginfo=info, compress_level=1)
+        return buffer.getvalue()
+
+
+def load_matte(f):
+    """StripMatte from StripMatte.encode() output; alpha PNGs without a mode are used as they are"""
+    image = Image.open(f)
+    return StripMatte(image.convert('L'), image.info.get('alpha_mode', 'soft'))
+
+
+def alpha_mask_path(image_path):
+    """Path of the alpha mask persisted next to an uploaded image"""
+    return os.path.splitext(image_path)[0] + '.alpha.png'
+
@@ -0,0 +1,145 @@
+"""
+Compiled Model Cache
+Stores compiled model artifacts (frozen TorchScript, exported ONNX) next to the weights
+file and reuses them across boots until the weights, torch version or model settings change.
+"""
+
+import glob
+import hashlib
+import os
+
+import torch
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompiledModelCache:
+    """On-disk cache of model artifacts keyed by weights hash, torch version and settings"""
+
+    SUFFIX = '.torchscript.pt'
+
+    # Bumped when the artifact contents change, so older artifacts are rebuilt
+    FORMAT_VERSION = '3'
+
+    def __init__(self, weights_path, suffix=SUFFIX, name=None):
+        """
+        Args:
+            weights_path: Path to the .pth weights; artifacts are written next to it
+            suffix: Artifact file suffix, one per artifact kind
+            name: Artifact base name (defaults to the weights file name), so
+                variants sharing one weights file keep separate artifacts
+        """
+        self.weights_path = weights_path
+        self.prefix = os.path.splitext(weights_path)[0]
+        if name:
+            self.prefix = os.path.join(os.path.dirname(weights_path), name)
+        self.suffix = suffix
+        self._weights_digest = None
+
+    def key(self, settings):
+        """Cache key for the current weights, torch version and a settings string"""
+        if self._weights_digest is None:
+            self._weights_digest = file_sha256(self.weights_path)
+
+        digest = hashlib.sha256()
+        for part in (self._weights_digest, torch.__version__, self.FORMAT_VERSION, settings):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:16]
+
+    def artifact_path(self, key):
+        """Artifact path for a cache key"""
+        return f"{self.prefix}.{key}{self.suffix}"
+
+    def load(self, key, device):
+        """Load and optimize the TorchScript artifact for a key, or None if it is missing or unreadable"""
+        path = self.artifact_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            return optimize_frozen(torch.jit.load(path, map_location=device))
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable compiled model {path}: {e}")
+            return None
+
+    def compile(self, model, example_input, key):
+        """
+        Trace and freeze an eval-mode model, save it under key, then optimize it
+
+        Tracing records sizes the model computes as Python numbers as
+        constants. U2NET/U2NETP read them from tensor shapes, so their graphs
+        accept any batch and input size; u2net_lite's upsample sizes are ints,
+        so its graph only works at the example's size. The saved file is
+        reloaded and run on the example and on a second batch and input size
+        before it replaces the previous artifact, and a graph that doesn't
+        generalize is rejected.
+
+        The frozen module is what gets saved: optimize_for_inference rewrites
+        the graph into backend-specific ops (e.g. oneDNN prepacked weights)
+        that torch.jit.load can't always read back, so it runs after every
+        load instead.
+
+        Returns:
+            The compiled module
+
+        Raises:
+            Exception: if the saved artifact can't be loaded back or only runs at the example size
+        """
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example_input, check_trace=False)
+            frozen = torch.jit.freeze(traced.eval())
+
+        path = self.artifact_path(key)
+        tmp_path = path + '.tmp'
+        torch.jit.save(frozen, tmp_path)
+        try:
+            reloaded = torch.jit.load(tmp_path, map_location=example_input.device)
+            _check_shapes(reloaded, example_input)
+        except Exception as e:
+            os.remove(tmp_path)
+            raise Exception(f"Compiled model failed its load check: {e}")
+        os.replace(tmp_path, path)
+
+        self.remove_stale(keep=path)
+        return optimize_frozen(reloaded)
+
+    def remove_stale(self, keep):
+        """Delete artifacts of this kind built from older weights, torch versions or settings"""
+        for path in glob.glob(f"{glob.escape(self.prefix)}.*{self.suffix}"):
+            if path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def optimize_frozen(module):
+    """Apply optimize_for_inference to a loaded frozen module, keeping it as is if the pass fails"""
+    try:
+        return torch.jit.optimize_for_inference(module)
+    except Exception as e:
+        print(f"⚠️ optimize_for_inference failed, using the frozen model: {e}")
+        return module
+
+
+def _check_shapes(module, example_input):
+    """Run a compiled module at the example's shape and at another batch and input size"""
+    batch, channels, height, width = example_input.shape
+    probe = torch.rand(batch + 1, channels, max(32, height - 64), max(32, width - 64), device=example_input.device)
+    if example_input.is_contiguous(memory_format=torch.channels_last):
+        probe = probe.contiguous(memory_format=torch.channels_last)
+
+    with torch.no_grad():
+        module(example_input)
+        output = module(probe)
+    if output.shape[0] != probe.shape[0] or tuple(output.shape[-2:]) != tuple(probe.shape[-2:]):
+        raise Exception(f"output shape {tuple(output.shape)} for input {tuple(probe.shape)}; "
+                        "the traced graph only fits the example size")
@@ -0,0 +1,168 @@
+"""
+Model Registry
+Lazily loads U2Net variants on first use and evicts the least recently used
+ones when their combined size exceeds a memory budget. Each variant is loaded
+once and serves every output head its quality tiers ask for.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from model.u2net import U2NET, U2NETP, U2NETInference
+from model.u2net_refactor import U2NET_lite
+from services.resolution import parse_input_size
+
+# Model variants: (network builder, default weights path)
+MODEL_VARIANTS = {
+    'u2net': (lambda: U2NET(3, 1), 'saved_models/u2net/u2net.pth'),
+    'u2netp': (lambda: U2NETP(3, 1), 'saved_models/u2netp/u2netp.pth'),
+    'u2net_lite': (U2NET_lite, 'saved_models/u2netp/u2netp.pth'),
+}
+
+# Per-request quality tiers: tier=variant[:head][@input_size]
+DEFAULT_QUALITY_TIERS = 'fast=u2netp@256,balanced=u2net@320,best=u2net:d0@480'
+
+
+def parse_quality_tiers(spec):
+    """
+    Parse a tier spec such as 'fast=u2netp@256,balanced=u2net,best=u2net:d0@480'
+
+    Returns:
+        Dict of tier -> (variant, head or None, input size or None);
+        None means the service default
+    """
+    tiers = {}
+    for entry in spec.split(','):
+        if not entry.strip():
+            continue
+        tier, _, model = entry.partition('=')
+        model, _, input_size = model.strip().partition('@')
+        variant, _, head = model.partition(':')
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"Unknown model variant '{variant}' for quality tier '{tier.strip()}'")
+        if head and head not in U2NETInference.HEADS:
+            raise ValueError(f"Unknown output head '{head}' for quality tier '{tier.strip()}'")
+        tiers[tier.strip()] = (variant, head or None, parse_input_size(input_size))
+    return tiers
+
+
+class LoadedModel:
+    """A loaded engine together with its batcher and approximate resident size"""
+
+    def __init__(self, key, engine, batcher, size_bytes, heads=('d1',)):
+        """
+        Args:
+            key: Registry key (the model variant)
+            engine: Loaded inference engine
+            batcher: MicroBatcher feeding the engine
+            size_bytes: Approximate size of one copy of the model
+            heads: Output heads the engine computes, in output channel order
+        """
+        self.key = key
+        self.engine = engine
+        self.batcher = batcher
+        self.size_bytes = size_bytes
+        self.heads = tuple(heads)
+
+    def head_output(self, pred, head):
+        """Select one head's (N, H, W) probabilities from a (N, C, H, W) prediction"""
+        return pred[:, self.heads.index(head)]
+
+
+class _Loading:
+    """A load in progress that other callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.model = None
+        self.error = None
+
+
+class ModelRegistry:
+    """Lazily loaded models with LRU eviction under a memory budget"""
+
+    def __init__(self, loader, memory_budget_mb=0):
+        """
+        Args:
+            loader: Callable taking a key and returning a LoadedModel (raises on failure)
+            memory_budget_mb: Combined size allowed for resident models (0 = unlimited); compared
+                against one copy of each model, since every process holding models holds them all
+        """
+        self.loader = loader
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._models = OrderedDict()  # key -> LoadedModel, least recently used first
+        self._loading = {}  # key -> _Loading
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the model for key, loading it (and evicting others) if needed
+
+        Loads run outside the lock, so requests for resident models never wait
+        on a slow load; concurrent requests for the same key share one load.
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            loading = self._loading.get(key)
+            owner = loading is None
+            if owner:
+                loading = self._loading[key] = _Loading()
+
+        if not owner:
+            loading.done.wait()
+            if loading.error is not None:
+                raise loading.error
+            return loading.model
+
+        try:
+            model = self.loader(key)
+        except Exception as e:
+            loading.error = e
+            raise
+        else:
+            loading.model = model
+            with self._lock:
+                self._models[key] = model
+                self._evict(keep=key)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.done.set()
+        return model
+
+    def loaded_keys(self):
+        """Keys of resident models, least recently used first"""
+        with self._lock:
+            return list(self._models)
+
+    def resident_bytes(self):
+        """Approximate combined size of resident models"""
+        with self._lock:
+            return sum(model.size_bytes for model in self._models.values())
+
+    def _evict(self, keep):
+        """Drop least recently used models until the budget is met (caller holds the lock)"""
+        if not self.memory_budget:
+            return
+
+        total = sum(model.size_bytes for model in self._models.values())
+        for key in list(self._models):
+            if total <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+
+            model = self._models.pop(key)
+            total -= model.size_bytes
+            # In-flight requests keep their reference until their batch finishes
+            model.batcher.close()
+            print(f"♻️ Evicted model {key} ({model.size_bytes / (1024 * 1024):.1f} MB)")
+
+
+def weights_size(path):
+    """Approximate resident size of a model from its weights file"""
+    return os.path.getsize(path) if os.path.exists(path) else 0
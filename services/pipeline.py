@@ -0,0 +1,120 @@
+"""
+Stage Pipeline
+Runs each request through a chain of stages (decode -> infer -> encode), each
+with its own worker threads and a bounded queue in front of it. Consecutive
+requests overlap: one decodes while another is in the model forward and a
+third is being encoded. Per-stage busy time shows which stage is the bottleneck.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class Stage:
+    """One pipeline stage: a function, its worker threads and its input queue"""
+
+    def __init__(self, name, fn, workers=1, queue_size=8):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+
+class StagePipeline:
+    """Chain of thread-pool stages connected by bounded queues"""
+
+    def __init__(self, stages, queue_size=8):
+        """
+        Args:
+            stages: List of (name, fn, workers); each fn takes the previous stage's
+                output (the submitted item for the first stage) and returns the next one
+            queue_size: Items waiting in front of each stage before the stage feeding
+                it blocks, so a slow stage applies backpressure instead of piling up work
+        """
+        self.stages = [Stage(name, fn, workers, queue_size) for name, fn, workers in stages]
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+        for index, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                threading.Thread(target=self._run, args=(index,), name=f'pipeline-{stage.name}-{i}',
+                                 daemon=True).start()
+
+    def submit(self, item):
+        """
+        Queue an item at the first stage, blocking while that stage's queue is full
+
+        Returns:
+            Future resolving to the last stage's output, or to the first exception raised
+        """
+        future = Future()
+        self.stages[0].queue.put((item, future))
+        return future
+
+    def run(self, item):
+        """Run an item through every stage and wait for the result"""
+        return self.submit(item).result()
+
+    def queued(self, name):
+        """Items waiting in front of a stage"""
+        for stage in self.stages:
+            if stage.name == name:
+                return stage.queue.qsize()
+        raise KeyError(name)
+
+    def stats(self):
+        """Per-stage load; the stage with the highest utilization is the bottleneck"""
+        elapsed = max(time.perf_counter() - self._started, 1e-6)
+        with self._lock:
+            return {
+                stage.name: {
+                    'workers': stage.workers,
+                    'active': stage.active,
+                    'queued': stage.queue.qsize(),
+                    'processed': stage.processed,
+                    'failed': stage.failed,
+                    'avg_ms': round(stage.busy_seconds * 1000 / stage.processed, 1) if stage.processed else None,
+                    # Fraction of the stage's thread time spent working since startup
+                    'utilization': round(stage.busy_seconds / (elapsed * stage.workers), 3)
+                }
+                for stage in self.stages
+            }
+
+    def _run(self, index):
+        """Worker loop for one stage: run items and hand them to the next stage"""
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item, future = stage.queue.get()
+            with self._lock:
+                stage.active += 1
+            start = time.perf_counter()
+            try:
+                result = stage.fn(item)
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+            seconds = time.perf_counter() - start
+
+            with self._lock:
+                stage.active -= 1
+                stage.busy_seconds += seconds
+                stage.processed += 1
+                if error is not None:
+                    stage.failed += 1
+
+            # Failed items skip the remaining stages; blocking on a full queue is the backpressure
+            if error is not None:
+                future.set_exception(error)
+            elif next_stage is None:
+                future.set_result(result)
+            else:
+                next_stage.queue.put((result, future))
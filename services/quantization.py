@@ -0,0 +1,142 @@
+"""
+Int8 Quantization for U2Net
+Post-training static quantization on CPU with a small calibration step,
+plus a mask-quality report against the fp32 model.
+
+Usage:
+    python -m services.quantization --holdout path/to/images [--calibration static/inputs]
+"""
+
+import argparse
+import copy
+import io
+import os
+
+import numpy as np
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+
+def quantized_backend():
+    """Pick the best available quantized CPU kernel backend"""
+    for backend in ('x86', 'fbgemm', 'qnnpack'):
+        if backend in torch.backends.quantized.supported_engines:
+            return backend
+    raise Exception("No quantized CPU backend available in this torch build")
+
+
+def load_image_tensors(directory, preprocess, limit=None):
+    """
+    Load model-input tensors from every image in a directory
+
+    Args:
+        directory: Folder with sample images
+        preprocess: Callable returning (tensor, image, size) for an image path
+        limit: Maximum number of images to load
+    """
+    if not directory or not os.path.isdir(directory):
+        return []
+
+    filenames = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if limit:
+        filenames = filenames[:limit]
+
+    return [preprocess(os.path.join(directory, f))[0] for f in filenames]
+
+
+def quantize_model(model, calibration_inputs):
+    """
+    Return an int8 copy of an eval-mode float model
+
+    Uses FX graph-mode post-training static quantization: Conv+BN+ReLU are
+    fused, observers record activation ranges over the calibration inputs,
+    and the graph is converted to quantized kernels. Inputs and outputs stay
+    float, so the model is a drop-in replacement.
+    """
+    if not calibration_inputs:
+        raise Exception("At least one calibration image is required for int8 quantization")
+
+    backend = quantized_backend()
+    torch.backends.quantized.engine = backend
+
+    model = copy.deepcopy(model).cpu().eval()
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs=(calibration_inputs[0],))
+
+    with torch.no_grad():
+        for tensor in calibration_inputs:
+            prepared(tensor)
+
+    return convert_fx(prepared)
+
+
+def model_size_mb(model):
+    """Serialized state dict size in MB"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def mask_quality_delta(reference, candidate, inputs, threshold=0.5):
+    """
+    Compare candidate masks against the reference model's masks
+
+    Returns:
+        Dict with mean absolute error of the soft masks and IoU of the
+        thresholded masks over all inputs
+    """
+    errors, ious = [], []
+
+    with torch.no_grad():
+        for tensor in inputs:
+            expected = reference(tensor)
+            actual = candidate(tensor)
+
+            errors.append((expected - actual).abs().mean().item())
+
+            expected_fg = expected > threshold
+            actual_fg = actual > threshold
+            union = (expected_fg | actual_fg).sum().item()
+            ious.append((expected_fg & actual_fg).sum().item() / union if union else 1.0)
+
+    return {
+        'images': len(inputs),
+        'mean_abs_error': float(np.mean(errors)) if errors else 0.0,
+        'mean_iou': float(np.mean(ious)) if ious else 1.0,
+        'min_iou': float(np.min(ious)) if ious else 1.0
+    }
+
+
+def main():
+    from services.background_remover import BackgroundRemoverService
+
+    parser = argparse.ArgumentParser(description='Report int8 vs fp32 mask quality for U2Net')
+    parser.add_argument('--holdout', required=True, help='Folder of held-out evaluation images')
+    parser.add_argument('--calibration', default='static/inputs', help='Folder of calibration images')
+    parser.add_argument('--calibration-images', type=int, default=8)
+    args = parser.parse_args()
+
+    service = BackgroundRemoverService(fuse_batchnorm=False, compile_model=False)
+    if not service.is_model_loaded():
+        raise SystemExit(1)
+
+    reference = service.get_model().engine.model.cpu()
+    calibration = load_image_tensors(args.calibration, service._preprocess_image, args.calibration_images)
+    holdout = load_image_tensors(args.holdout, service._preprocess_image)
+
+    print(f"🔄 Calibrating on {len(calibration)} images...")
+    quantized = quantize_model(reference, calibration)
+
+    report = mask_quality_delta(reference, quantized, holdout)
+    print(f"📦 Model size: fp32 {model_size_mb(reference):.1f} MB -> int8 {model_size_mb(quantized):.1f} MB")
+    print(f"📊 Held-out images: {report['images']}")
+    print(f"   Mean abs error: {report['mean_abs_error']:.4f}")
+    print(f"   Mean IoU:       {report['mean_iou']:.4f}")
+    print(f"   Min IoU:        {report['min_iou']:.4f}")
+
+
+if __name__ == '__main__':
+    main()
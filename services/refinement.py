@@ -0,0 +1,122 @@
+"""
+Boundary Refinement
+Re-predicts only the uncertain band around the coarse mask edge from
+full-resolution crops of the original, so high-resolution edge quality
+costs time proportional to edge length rather than image area.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+
+class BoundaryRefiner:
+    """Refines a full-size mask by re-running the model on crops along its edge"""
+
+    def __init__(self, grid=6, max_tiles=12, band_width=2, context=0.25, min_band_fraction=0.005):
+        """
+        Args:
+            grid: Cells along the longest image side; each cell is one refinement tile
+            max_tiles: Most tiles refined per image (cells with the widest band first)
+            band_width: Half-width of the uncertain band, in coarse model pixels
+            context: Extra margin around each cell fed to the model, as a fraction of the cell
+            min_band_fraction: Smallest share of band pixels for a cell to be refined
+        """
+        self.grid = grid
+        self.max_tiles = max_tiles
+        self.band_width = band_width
+        self.context = context
+        self.min_band_fraction = min_band_fraction
+
+    def should_refine(self, original_size, input_size):
+        """Refinement only pays off when the source is well above model resolution"""
+        return max(original_size) >= 2 * input_size
+
+    def uncertain_band(self, mask, input_size):
+        """
+        Boolean map of pixels near the coarse edge or with ambiguous probability
+
+        Args:
+            mask: Full-size uint8 mask (0-255) upsampled from the model output
+            input_size: Model input size the coarse mask was predicted at
+        """
+        # One coarse pixel covers this many source pixels
+        scale = max(mask.shape) / float(input_size)
+        radius = max(1, int(round(scale * self.band_width)))
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * radius + 1, 2 * radius + 1))
+
+        binary = (mask >= 128).astype(np.uint8)
+        band = cv2.dilate(binary, kernel) != cv2.erode(binary, kernel)
+        band |= (mask > 25) & (mask < 230)
+        return band
+
+    def select_tiles(self, band):
+        """
+        Pick the cells that contain the most band pixels
+
+        Returns:
+            List of (x0, y0, x1, y1) cell boxes
+        """
+        height, width = band.shape
+        cell = int(math.ceil(max(height, width) / float(self.grid)))
+        ys = np.arange(0, height, cell)
+        xs = np.arange(0, width, cell)
+
+        # Band pixel count per cell without materializing a padded copy
+        counts = np.add.reduceat(band, ys, axis=0, dtype=np.uint32)
+        counts = np.add.reduceat(counts, xs, axis=1, dtype=np.uint32)
+
+        min_pixels = max(1, int(self.min_band_fraction * cell * cell))
+        candidates = [(counts[r, c], r, c) for r, c in zip(*np.nonzero(counts >= min_pixels))]
+        candidates.sort(reverse=True)
+
+        tiles = []
+        for _, r, c in candidates[:self.max_tiles]:
+            y0, x0 = int(ys[r]), int(xs[c])
+            tiles.append((x0, y0, min(x0 + cell, width), min(y0 + cell, height)))
+        return tiles
+
+    def refine(self, image, mask, input_size, predict):
+        """
+        Refine the mask edge from full-resolution crops
+
+        Args:
+            image: Original PIL RGB image
+            mask: Full-size uint8 mask (0-255); a refined copy is returned
+            input_size: Model input size the coarse mask was predicted at
+            predict: Callable taking a list of PIL crops and returning a list of
+                2D float probability maps (0-1), run as one batch
+
+        Returns:
+            Refined uint8 mask
+        """
+        if not self.should_refine(image.size, input_size):
+            return mask
+
+        band = self.uncertain_band(mask, input_size)
+        tiles = self.select_tiles(band)
+        if not tiles:
+            return mask
+
+        width, height = image.size
+        crop_boxes = []
+        for x0, y0, x1, y1 in tiles:
+            margin = int(max(x1 - x0, y1 - y0) * self.context)
+            crop_boxes.append((max(0, x0 - margin), max(0, y0 - margin),
+                               min(width, x1 + margin), min(height, y1 + margin)))
+
+        predictions = predict([image.crop(box) for box in crop_boxes])
+
+        refined = mask.copy()
+        for (x0, y0, x1, y1), (cx0, cy0, cx1, cy1), prob in zip(tiles, crop_boxes, predictions):
+            prob = cv2.resize(np.asarray(prob, dtype=np.float32), (cx1 - cx0, cy1 - cy0),
+                              interpolation=cv2.INTER_LINEAR)
+            cell_prob = prob[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+
+            # Only band pixels are replaced; confident interior/exterior stays as predicted
+            cell_band = band[y0:y1, x0:x1]
+            cell = refined[y0:y1, x0:x1]
+            cell[cell_band] = np.clip(cell_prob[cell_band] * 255.0, 0, 255).astype(np.uint8)
+
+        return refined
@@ -0,0 +1,62 @@
+"""
+Model Input Resolution
+Helpers for choosing the square input size U2Net runs at. Sizes are kept to
+multiples of 32 so the five ceil-mode 2x poolings divide evenly.
+"""
+
+SIZE_MULTIPLE = 32
+MIN_INPUT_SIZE = 64
+MAX_INPUT_SIZE = 1024
+
+# Candidate sizes for 'auto', smallest first
+DEFAULT_AUTO_SIZES = (192, 256, 320, 480)
+
+
+def round_input_size(size):
+    """Round a size to the nearest multiple of 32 within the supported range"""
+    size = int(round(float(size) / SIZE_MULTIPLE)) * SIZE_MULTIPLE
+    return min(MAX_INPUT_SIZE, max(MIN_INPUT_SIZE, size))
+
+
+def parse_input_size(value):
+    """
+    Parse an input size setting
+
+    Returns:
+        'auto', a rounded int, or None for empty values
+
+    Raises:
+        ValueError: if the value is neither 'auto' nor a number
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and value.strip().lower() == 'auto':
+        return 'auto'
+    return round_input_size(value)
+
+
+def parse_auto_sizes(spec):
+    """Parse a comma-separated list of auto sizes into sorted, rounded, unique values"""
+    if isinstance(spec, str):
+        spec = [part for part in spec.split(',') if part.strip()]
+    return tuple(sorted({round_input_size(size) for size in spec}))
+
+
+def choose_input_size(source_size, queue_depth=0, batch_size=1, sizes=DEFAULT_AUTO_SIZES):
+    """
+    Pick an input size from the source dimensions and current load
+
+    Starts from the largest candidate that does not upscale the source, then
+    steps down one candidate for every full batch already waiting.
+
+    Args:
+        source_size: (width, height) of the original image
+        queue_depth: Requests queued or preprocessing for the same model
+        batch_size: Requests served per forward pass
+        sizes: Candidate sizes, smallest first
+    """
+    longest = max(source_size)
+    fitting = [size for size in sizes if size <= longest] or [sizes[0]]
+
+    index = len(fitting) - 1 - queue_depth // max(1, batch_size)
+    return fitting[max(0, index)]
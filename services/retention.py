@@ -0,0 +1,229 @@
+"""
+Retention Manager
+Keeps the stored uploads and results within an age limit, an image count and
+a byte budget. Artifacts are tracked from FileStore events (writes, reads and
+deletes) in per-directory LRU order, so an eviction pass only looks at the
+oldest entries instead of scanning the tree. A slow periodic rescan picks up
+files written outside the store. Eviction runs on a background thread.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Group:
+    """An artifact and its companions (e.g. X.png, X.thumb.webp, X.alpha.png), evicted together"""
+
+    def __init__(self, last_access):
+        self.files = {}  # path -> size
+        self.last_access = last_access
+
+    @property
+    def size(self):
+        return sum(self.files.values())
+
+
+class RetentionManager:
+    """Age, count and byte-budget eviction for stored artifacts"""
+
+    def __init__(self, storage, directories, count_directory=None, max_files=100, max_age_days=7,
+                 max_bytes_mb=256, interval_seconds=300, rescan_hours=6):
+        """
+        Args:
+            storage: FileStore that artifacts are written, read and deleted through
+            directories: Directories under retention
+            count_directory: Directory whose artifact count is limited to max_files (e.g. processed results)
+            max_files: Artifacts kept in count_directory (0 = unlimited)
+            max_age_days: Artifacts not accessed for this long are removed (0 = keep forever)
+            max_bytes_mb: Combined size of all directories (0 = unlimited)
+            interval_seconds: Time between eviction passes
+            rescan_hours: Time between full rescans that pick up files written outside the store
+        """
+        self.storage = storage
+        self.directories = [os.path.normpath(directory) for directory in directories]
+        self.count_directory = os.path.normpath(count_directory) if count_directory else None
+        self.max_files = int(max_files)
+        self.max_age = float(max_age_days) * 86400
+        self.max_bytes = int(max_bytes_mb * 1024 * 1024)
+        self.interval = max(1.0, float(interval_seconds))
+        self.rescan_interval = float(rescan_hours) * 3600
+
+        self._lock = threading.Lock()
+        self._groups = {directory: OrderedDict() for directory in self.directories}  # stem -> _Group, LRU first
+        self._bytes = 0
+        self._reclaimed_bytes = 0
+        self._reclaimed_files = 0
+        self._evictions = {'age': 0, 'count': 0, 'bytes': 0}
+        self._last_pass = None
+        self._last_pass_ms = None
+        self._last_rescan = 0.0
+
+        self.rescan()
+        storage.subscribe(self.observe)
+        threading.Thread(target=self._run, name='retention', daemon=True).start()
+
+    def observe(self, event, path, size):
+        """FileStore listener: track writes, reads and deletes inside the managed directories"""
+        directory, stem = self._locate(path)
+        if directory is None:
+            return
+        path = os.path.normpath(path)
+        now = time.time()
+
+        with self._lock:
+            groups = self._groups[directory]
+            group = groups.get(stem)
+            if event == 'delete':
+                if group is not None and path in group.files:
+                    self._bytes -= group.files.pop(path)
+                    if not group.files:
+                        del groups[stem]
+                return
+
+            if event == 'write':
+                if group is None:
+                    group = groups[stem] = _Group(now)
+                self._bytes += size - group.files.get(path, 0)
+                group.files[path] = size
+            elif group is None or path not in group.files:
+                return  # read of an untracked file
+
+            group.last_access = now
+            groups.move_to_end(stem)
+
+    def run_once(self):
+        """One eviction pass; returns the number of bytes reclaimed"""
+        start = time.perf_counter()
+        if self.rescan_interval and time.time() - self._last_rescan >= self.rescan_interval:
+            self.rescan()
+
+        victims = self._select_victims(time.time())
+        reclaimed = 0
+        removed = 0
+        for group in victims:
+            for path, size in group.files.items():
+                try:
+                    if self.storage.delete(path):
+                        reclaimed += size
+                        removed += 1
+                except OSError as e:
+                    print(f"⚠️ Could not remove {path}: {e}")
+
+        with self._lock:
+            self._reclaimed_bytes += reclaimed
+            self._reclaimed_files += removed
+            self._last_pass = time.time()
+            self._last_pass_ms = round((time.perf_counter() - start) * 1000, 1)
+        if reclaimed:
+            print(f"♻️ Retention removed {len(victims)} artifacts ({reclaimed / (1024 * 1024):.1f} MB)")
+        return reclaimed
+
+    def rescan(self):
+        """Rebuild the tracked state from the directories (at startup, then every rescan_hours)"""
+        groups = {directory: {} for directory in self.directories}
+        total = 0
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as scan:
+                for item in scan:
+                    if not item.is_file() or _ignored(item.name):
+                        continue
+                    stat = item.stat()
+                    stem = item.name.split('.', 1)[0]
+                    group = groups[directory].setdefault(stem, _Group(stat.st_mtime))
+                    group.files[os.path.normpath(item.path)] = stat.st_size
+                    group.last_access = max(group.last_access, stat.st_mtime)
+                    total += stat.st_size
+
+        with self._lock:
+            for directory, found in groups.items():
+                # Keep access times and in-memory files the store already told us about
+                for stem, known in self._groups[directory].items():
+                    group = found.get(stem)
+                    if group is None:
+                        if any(self.storage.exists(path) for path in known.files):
+                            found[stem] = known
+                            total += known.size
+                        continue
+                    group.last_access = max(group.last_access, known.last_access)
+                    for path, size in known.files.items():
+                        if path not in group.files and self.storage.exists(path):
+                            group.files[path] = size
+                            total += size
+                self._groups[directory] = OrderedDict(sorted(found.items(), key=lambda item: item[1].last_access))
+            self._bytes = total
+            self._last_rescan = time.time()
+
+    def stats(self):
+        """Current usage and what eviction has reclaimed so far"""
+        with self._lock:
+            return {
+                'bytes': self._bytes,
+                'budget_bytes': self.max_bytes or None,
+                'artifacts': sum(len(groups) for groups in self._groups.values()),
+                'directories': {
+                    directory: {'artifacts': len(groups), 'bytes': sum(group.size for group in groups.values())}
+                    for directory, groups in self._groups.items()
+                },
+                'reclaimed_bytes': self._reclaimed_bytes,
+                'reclaimed_files': self._reclaimed_files,
+                'evictions': dict(self._evictions),
+                'last_pass': self._last_pass,
+                'last_pass_ms': self._last_pass_ms
+            }
+
+    def _select_victims(self, now):
+        """Pop the groups to evict, oldest first (by age, then count, then byte budget)"""
+        victims = []
+        with self._lock:
+            if self.max_age:
+                cutoff = now - self.max_age
+                for groups in self._groups.values():
+                    while groups and next(iter(groups.values())).last_access < cutoff:
+                        victims.append(self._pop(groups, 'age'))
+
+            counted = self._groups.get(self.count_directory)
+            if self.max_files and counted is not None:
+                while len(counted) > self.max_files:
+                    victims.append(self._pop(counted, 'count'))
+
+            if self.max_bytes:
+                while self._bytes > self.max_bytes:
+                    # Least recently used across directories: compare each directory's oldest entry
+                    oldest = min((groups for groups in self._groups.values() if groups),
+                                 key=lambda groups: next(iter(groups.values())).last_access, default=None)
+                    if oldest is None:
+                        break
+                    victims.append(self._pop(oldest, 'bytes'))
+        return victims
+
+    def _pop(self, groups, reason):
+        """Remove the least recently used group (caller holds the lock)"""
+        _, group = groups.popitem(last=False)
+        self._bytes -= group.size
+        self._evictions[reason] += 1
+        return group
+
+    def _locate(self, path):
+        """(managed directory, artifact stem) for a path, or (None, None) if it isn't managed"""
+        directory, filename = os.path.split(os.path.normpath(path))
+        if directory not in self._groups or _ignored(filename):
+            return None, None
+        return directory, filename.split('.', 1)[0]
+
+    def _run(self):
+        """Eviction loop"""
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Retention pass failed: {e}")
+
+
+def _ignored(filename):
+    """Placeholders (.gitkeep) and partially written files are never tracked"""
+    return filename.startswith('.') or filename.endswith('.tmp')
@@ -0,0 +1,184 @@
+"""
+File Store
+Keeps uploads and results in memory for the request path and persists them to
+disk on a background writer thread, so requests never wait on file I/O.
+Files stay readable from memory until they have landed on disk.
+"""
+
+import io
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+
+class FileStore:
+    """In-memory file buffers with optional write-behind persistence"""
+
+    def __init__(self, persist=True, memory_mb=256):
+        """
+        Args:
+            persist: Write files to disk in the background; otherwise they only live in memory
+            memory_mb: Memory kept for files that are not (or not yet) on disk; when
+                persistence is off, the least recently used files are dropped beyond it,
+                otherwise writes wait for the background writer to catch up
+        """
+        self.persist = persist
+        self.memory_budget = int(memory_mb * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()  # path -> bytes not (yet) on disk, least recently used first
+        self._buffered_bytes = 0
+        self._drained = threading.Condition(self._lock)  # signalled when buffered bytes go down
+        self._writing = None  # path the writer is putting on disk outside the lock
+        self._deleted = set()  # paths deleted while being written; the writer removes them again
+        self._queue = queue.Queue()
+        self._listeners = []
+
+        if persist:
+            self._worker = threading.Thread(target=self._run, name='file-writer', daemon=True)
+            self._worker.start()
+
+    def write(self, path, data):
+        """Make data readable at path immediately and persist it in the background"""
+        evicted = []
+        with self._lock:
+            # Backpressure: past the budget, wait while the writer is still draining buffers to disk
+            while (self.persist and self._buffered_bytes and self._buffered_bytes + len(data) > self.memory_budget
+                   and (self._queue.qsize() or self._writing is not None)):
+                self._drained.wait()
+            self._buffered_bytes += len(data) - len(self._buffers.pop(path, b''))
+            self._buffers[path] = data
+            if not self.persist:
+                evicted = self._evict(keep=path)
+
+        if self.persist:
+            self._queue.put(path)
+        self._notify('write', path, len(data))
+        for evicted_path in evicted:
+            self._notify('delete', evicted_path, None)
+
+    def read(self, path):
+        """File contents from memory or disk, or None if the file does not exist"""
+        with self._lock:
+            data = self._buffers.get(path)
+            if data is not None:
+                self._buffers.move_to_end(path)
+
+        if data is None:
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        self._notify('read', path, None)
+        return data
+
+    def open(self, path):
+        """Readable file object for path, or None if the file does not exist"""
+        data = self.read(path)
+        return io.BytesIO(data) if data is not None else None
+
+    def exists(self, path):
+        """Check if a file is buffered or on disk"""
+        with self._lock:
+            if path in self._buffers:
+                return True
+        return os.path.exists(path)
+
+    def size(self, path):
+        """Size of a file in bytes, or None if it does not exist"""
+        with self._lock:
+            data = self._buffers.get(path)
+            if data is not None:
+                return len(data)
+        if os.path.exists(path):
+            return os.path.getsize(path)
+        return None
+
+    def delete(self, path):
+        """Remove a file from memory and disk; returns whether it existed"""
+        with self._lock:
+            data = self._buffers.pop(path, None)
+            if data is not None:
+                self._buffered_bytes -= len(data)
+                self._drained.notify_all()
+            if path == self._writing:
+                self._deleted.add(path)
+        existed = data is not None
+
+        try:
+            os.remove(path)
+            existed = True
+        except FileNotFoundError:
+            pass
+        if existed:
+            self._notify('delete', path, None)
+        return existed
+
+    def subscribe(self, listener):
+        """Call listener(event, path, size) after every 'write', 'read' and 'delete' (size is None unless writing)"""
+        self._listeners.append(listener)
+
+    def flush(self):
+        """Block until every queued write has reached the disk"""
+        if self.persist:
+            self._queue.join()
+
+    def pending(self):
+        """Number of writes not yet on disk"""
+        return self._queue.qsize() if self.persist else 0
+
+    def _run(self):
+        """Writer loop: persist queued paths, then drop their in-memory copies"""
+        while True:
+            path = self._queue.get()
+            try:
+                with self._lock:
+                    data = self._buffers.get(path)
+                    if data is None:
+                        continue  # deleted or already written by an earlier queue entry
+                    self._writing = path
+
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+
+                with self._lock:
+                    # Deleted during the write: the replace above brought the file back
+                    if path in self._deleted:
+                        self._deleted.discard(path)
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    # A newer write to the same path stays buffered for its own queue entry
+                    if self._buffers.get(path) is data:
+                        del self._buffers[path]
+                        self._buffered_bytes -= len(data)
+            except Exception as e:
+                print(f"❌ Could not write {path}: {e}")
+            finally:
+                with self._lock:
+                    self._writing = None
+                    self._deleted.clear()
+                    self._drained.notify_all()
+                self._queue.task_done()
+
+    def _notify(self, event, path, size):
+        for listener in self._listeners:
+            try:
+                listener(event, path, size)
+            except Exception as e:
+                print(f"⚠️ Storage listener failed for {path}: {e}")
+
+    def _evict(self, keep):
+        """Drop least recently used memory-only files beyond the budget (caller holds the lock); returns their paths"""
+        evicted = []
+        for path in list(self._buffers):
+            if self._buffered_bytes <= self.memory_budget:
+                break
+            if path != keep:
+                self._buffered_bytes -= len(self._buffers.pop(path))
+                evicted.append(path)
+        return evicted
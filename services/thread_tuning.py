@@ -0,0 +1,59 @@
+"""
+Thread Tuning
+Loads and applies the thread configuration picked by `python autotune.py`:
+torch intra-op and inter-op pool sizes, OpenCV's pool size and the number of
+requests inferring concurrently. Sizing these together avoids the pools
+oversubscribing the cores, which shows up as erratic tail latency.
+"""
+
+import json
+import os
+
+import cv2
+import torch
+
+DEFAULT_TUNING_FILE = 'thread_tuning.json'
+
+TUNING_KEYS = ('intra_op_threads', 'inter_op_threads', 'inference_slots', 'opencv_threads')
+
+
+def load_thread_settings(path=DEFAULT_TUNING_FILE):
+    """
+    Read an autotune result
+
+    Returns:
+        Dict with TUNING_KEYS (plus the measurements they were picked from), or
+        None if there is no tuning file
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        settings = json.load(f)
+
+    missing = [key for key in TUNING_KEYS if key not in settings]
+    if missing:
+        raise ValueError(f"Thread tuning file {path} is missing {', '.join(missing)}")
+    return settings
+
+
+def save_thread_settings(settings, path=DEFAULT_TUNING_FILE):
+    """Write an autotune result atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(settings, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def apply_thread_settings(settings):
+    """
+    Size the torch and OpenCV thread pools for this process
+
+    The inter-op pool can only be sized before torch first uses it, so this
+    belongs at startup, before any model is loaded.
+    """
+    torch.set_num_threads(int(settings['intra_op_threads']))
+    try:
+        torch.set_num_interop_threads(int(settings['inter_op_threads']))
+    except RuntimeError:
+        print("⚠️ torch inter-op threads already started, keeping the current pool")
+    cv2.setNumThreads(int(settings['opencv_threads']))
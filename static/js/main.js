@@ -158,7 +158,7 @@ function displayResults(result) {
     resultsSection.style.display = 'block';
     
     currentProcessedUrl = result.processed_url;
-    currentOriginalFile = result.original_filename;
+    currentOriginalFile = result.upload_filename || result.original_filename;
     
     const originalImage = document.getElementById('originalImage');
     const processedImage = document.getElementById('processedImage');
@@ -217,29 +217,25 @@ async function changeBackground(color) {
         const processedImage = document.getElementById('processedImage');
         processedImage.style.opacity = '0.5';
         
-        // Process with new background
-        const formData = new FormData();
-        
-        // Use the original uploaded file stored in currentFiles
-        if (currentFiles && currentFiles.length > 0) {
-            formData.append('file', currentFiles[0]);
-        } else {
-            // Fallback: fetch original image
-            const originalUrl = document.getElementById('originalImage').src;
-            const response = await fetch(originalUrl);
-            const blob = await response.blob();
-            formData.append('file', blob, 'image.png');
-        }
-        
-        formData.append('background_color', color);
-        formData.append('output_format', 'png');
-        
-        const uploadResponse = await fetch('/api/upload', {
+        // Recomposite from the stored mask (no model call)
+        const response = await fetch('/api/change-background', {
             method: 'POST',
-            body: formData
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                original_file: currentOriginalFile,
+                background_type: color === 'transparent' ? 'transparent' : 'color',
+                background_value: color,
+                output_format: 'png'
+            })
         });
         
-        const result = await uploadResponse.json();
+        let result = await response.json();
+        if (result.success) {
+            result.processed_url = result.url;
+        } else if (response.status === 404 && currentFiles && currentFiles.length > 0) {
+            // Fallback: no stored mask, reprocess the original upload
+            result = await reprocessWithBackground(currentFiles[0], color);
+        }
         
         if (result.success) {
             // Update processed image with cache-busting
@@ -259,6 +255,23 @@ async function changeBackground(color) {
     }
 }
 
+async function reprocessWithBackground(file, color) {
+    const formData = new FormData();
+    formData.append('file', file);
+    formData.append('background_color', color);
+    formData.append('output_format', 'png');
+    
+    const response = await fetch('/api/upload', {
+        method: 'POST',
+        body: formData
+    });
+    const result = await response.json();
+    if (result.success) {
+        currentOriginalFile = result.original_filename;
+    }
+    return result;
+}
+
 function openColorPicker() {
     document.getElementById('customColorPicker').click();
 }
@@ -0,0 +1,62 @@
+"""
+End-to-end smoke tests: upload an image through the Flask app and fetch the result.
+Skipped when the ML dependencies or the U2Net weights are not installed.
+"""
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('flask')
+pytest.importorskip('torch')
+pytest.importorskip('cv2')
+Image = pytest.importorskip('PIL.Image')
+
+from download_model import MODEL_PATH
+
+if not MODEL_PATH.exists():
+    pytest.skip(f"Model not found at {MODEL_PATH}", allow_module_level=True)
+
+
+@pytest.fixture(scope='module')
+def client():
+    import app as web
+    if web.bg_remover is None:
+        pytest.skip('Background remover failed to load')
+    web.app.config['TESTING'] = True
+    return web.app.test_client()
+
+
+def sample_image(size=(96, 64)):
+    """Small JPEG upload: a bright square on a dark background"""
+    image = Image.new('RGB', size, (20, 30, 40))
+    image.paste((230, 200, 90), (size[0] // 4, size[1] // 4, size[0] * 3 // 4, size[1] * 3 // 4))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+def test_upload_removes_background(client):
+    response = client.post('/api/upload', data={'file': (sample_image(), 'sample.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body['success']
+    assert body['processed_size'] > 0
+
+    result = client.get(body['processed_url'])
+    assert result.status_code == 200
+    processed = Image.open(io.BytesIO(result.data))
+    assert processed.size == (96, 64)
+    assert processed.mode == 'RGBA'
+
+
+def test_upload_rejects_unsupported_type(client):
+    response = client.post('/api/upload', data={'file': (io.BytesIO(b'not an image'), 'notes.txt')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400